@@ -2,37 +2,312 @@
 import subprocess
 import os
 import shutil
+import sys
 from dataclasses import dataclass
 
 SOURCE_ROOT = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+BUILD_CACHE_DIR = os.path.join(SOURCE_ROOT, ".build", "bench-cache")
+
+
+def tool_version(command):
+    try:
+        return subprocess.check_output(command, text=True, stderr=subprocess.STDOUT)
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def hash_inputs(paths, extra_inputs, exclude):
+    """Hash the contents and relative paths of the given files and directories.
+
+    Hidden files and directories such as .git and .build are skipped, as are
+    files for which `exclude` returns True.
+    """
+    import hashlib
+
+    digest = hashlib.sha256()
+    for extra_input in extra_inputs:
+        digest.update(extra_input.encode() + b"\0")
+
+    def add_file(path):
+        if exclude(path):
+            return
+        digest.update(os.path.relpath(path, SOURCE_ROOT).encode() + b"\0")
+        with open(path, "rb") as f:
+            digest.update(f.read())
+
+    for path in paths:
+        if os.path.isfile(path):
+            add_file(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            for filename in sorted(files):
+                if not filename.startswith("."):
+                    add_file(os.path.join(root, filename))
+    return digest.hexdigest()[:16]
+
+
+class Artifact:
+    """A build product cached in BUILD_CACHE_DIR under a hash of its inputs.
+
+    Rebuilding is skipped when the cache already has the artifact for the
+    current inputs, so switching back and forth between revisions does not
+    recompile anything that was built before. Artifacts created with
+    `cache=False` are used in place and rebuilt by every build step, e.g.
+    build directories that a tool reuses incrementally.
+    """
+
+    def __init__(self, name, built_path, build_commands, inputs,
+                 extra_inputs=lambda: [], exclude=lambda path: False, cache=True):
+        self.name = name
+        self.built_path = built_path
+        self.build_commands = build_commands
+        self.inputs = inputs
+        self.extra_inputs = extra_inputs
+        self.exclude = exclude
+        self.cache = cache
+        # Whether this invocation builds the artifact before using it
+        self.will_build = False
+        self._input_hash = None
+
+    @property
+    def input_hash(self):
+        if self._input_hash is None:
+            self._input_hash = hash_inputs(self.inputs, self.extra_inputs(), self.exclude)
+        return self._input_hash
+
+    @property
+    def cached_path(self):
+        if not self.cache:
+            return self.built_path
+        return os.path.join(
+            BUILD_CACHE_DIR, self.name, self.input_hash, os.path.basename(self.built_path))
+
+    @property
+    def path(self):
+        """The path to use the artifact from."""
+        if self.will_build or os.path.exists(self.cached_path):
+            return self.cached_path
+        return self.built_path
+
+    def build(self, runner, force=False):
+        if not self.cache:
+            print(f"===== Building {self.name} =====")
+            for command in self.build_commands():
+                runner.run_command(command)
+            return
+        if not force and os.path.exists(self.cached_path):
+            print(f"===== {self.name} is up to date ({self.input_hash}) =====")
+            return
+        print(f"===== Building {self.name} ({self.input_hash}) =====")
+        for command in self.build_commands():
+            runner.run_command(command)
+        if runner.dry_run:
+            return
+        # Copy under a temporary name first so that an interrupted copy is
+        # never mistaken for a complete artifact.
+        os.makedirs(os.path.dirname(self.cached_path), exist_ok=True)
+        temporary_path = self.cached_path + ".tmp"
+        shutil.copy2(self.built_path, temporary_path)
+        os.replace(temporary_path, self.cached_path)
+
+
+def coremark_build_commands():
+    wasi_sdk_path = os.getenv("WASI_SDK_PATH")
+    if wasi_sdk_path is None:
+        raise Exception("WASI_SDK_PATH environment variable not set")
+    return [[
+        "make",
+        "compile", "-C", os.path.join(SOURCE_ROOT, "Vendor", "coremark"),
+        "PORT_DIR=simple", f"CC={wasi_sdk_path}/bin/clang",
+        "PORT_CFLAGS=-O3 -D_WASI_EMULATED_PROCESS_CLOCKS -lwasi-emulated-process-clocks",
+        "EXE=.wasm"
+    ]]
+
+
+def wasi_io_build_commands():
+    wasi_sdk_path = os.getenv("WASI_SDK_PATH")
+    if wasi_sdk_path is None:
+        raise Exception("WASI_SDK_PATH environment variable not set")
+    output = ARTIFACTS["wasi-io"].built_path
+    return [
+        ["mkdir", "-p", os.path.dirname(output)],
+        [f"{wasi_sdk_path}/bin/clang", "-O2", "-o", output,
+         os.path.join(SOURCE_ROOT, "Benchmarks", "wasi-io", "wasi_io.c")],
+    ]
+
+
+def wasi_sdk_version():
+    wasi_sdk_path = os.getenv("WASI_SDK_PATH")
+    if wasi_sdk_path is None:
+        return []
+    version = tool_version([os.path.join(wasi_sdk_path, "bin", "clang"), "--version"])
+    version_file = os.path.join(wasi_sdk_path, "VERSION")
+    if os.path.exists(version_file):
+        with open(version_file) as f:
+            version += f.read()
+    return [version]
+
+
+def available_artifacts():
+    package_manifests = [
+        os.path.join(SOURCE_ROOT, filename)
+        for filename in sorted(os.listdir(SOURCE_ROOT))
+        if filename.startswith("Package") and filename.endswith((".swift", ".resolved"))
+    ]
+    artifacts = [
+        Artifact(
+            "coremark",
+            os.path.join(SOURCE_ROOT, "Vendor", "coremark", "coremark.wasm"),
+            coremark_build_commands,
+            inputs=[os.path.join(SOURCE_ROOT, "Vendor", "coremark")],
+            extra_inputs=wasi_sdk_version,
+            exclude=lambda path: path.endswith((".wasm", ".o")),
+        ),
+        Artifact(
+            "wasi-io",
+            os.path.join(SOURCE_ROOT, ".build", "bench", "wasi-io", "wasi_io.wasm"),
+            wasi_io_build_commands,
+            inputs=[os.path.join(SOURCE_ROOT, "Benchmarks", "wasi-io")],
+            extra_inputs=wasi_sdk_version,
+        ),
+        Artifact(
+            "wasmkit-cli",
+            os.path.join(SOURCE_ROOT, ".build", "release", "wasmkit-cli"),
+            lambda: [[
+                "swift", "build", "-c", "release", "--package-path", SOURCE_ROOT,
+                "--product", "wasmkit-cli"
+            ]],
+            inputs=[os.path.join(SOURCE_ROOT, "Sources")] + package_manifests,
+            extra_inputs=lambda: [tool_version(["swift", "--version"])],
+        ),
+    ]
+    return {artifact.name: artifact for artifact in artifacts}
+
+
+ARTIFACTS = available_artifacts()
+
+
+def wasmkit_revision_artifact(revision):
+    """Build wasmkit-cli of a git revision in its own worktree."""
+    commit = subprocess.check_output(
+        ["git", "-C", SOURCE_ROOT, "rev-parse", "--verify", f"{revision}^{{commit}}"],
+        text=True, stderr=subprocess.DEVNULL).strip()
+    worktree = os.path.join(SOURCE_ROOT, ".build", "bench-worktrees", commit)
+
+    def build_commands():
+        commands = []
+        if not os.path.exists(worktree):
+            commands.append([
+                "git", "-C", SOURCE_ROOT, "worktree", "add", "--detach", worktree, commit
+            ])
+        commands.append([
+            "swift", "build", "-c", "release", "--package-path", worktree,
+            "--product", "wasmkit-cli"
+        ])
+        return commands
+
+    def extra_inputs():
+        # Git object ids already hash the contents of the revision
+        entries = subprocess.check_output(
+            ["git", "-C", SOURCE_ROOT, "ls-tree", commit], text=True).splitlines()
+        entries = [
+            entry for entry in entries
+            if entry.split("\t", 1)[1] == "Sources" or entry.split("\t", 1)[1].startswith("Package")
+        ]
+        return entries + [tool_version(["swift", "--version"])]
+
+    return Artifact(
+        "wasmkit-cli",
+        os.path.join(worktree, ".build", "release", "wasmkit-cli"),
+        build_commands, inputs=[], extra_inputs=extra_inputs)
+
+
+def wasmkit_builds(revisions, binaries):
+    """Return (engine name, wasmkit-cli path or Artifact) of each WasmKit build to run."""
+    builds = []
+    for revision in revisions or []:
+        # Engine names are used as directory names
+        builds.append((f"WasmKit@{revision.replace('/', '-')}",
+                       wasmkit_revision_artifact(revision)))
+    for binary in binaries or []:
+        name, separator, path = binary.partition("=")
+        if not separator:
+            raise ValueError(f"--wasmkit-binary expects NAME=PATH, got '{binary}'")
+        builds.append((f"WasmKit@{name}", os.path.abspath(path)))
+    if not builds:
+        builds.append(("WasmKit", ARTIFACTS["wasmkit-cli"]))
+    return builds
 
 
 class Engine:
-    def __call__(self, runner, path):
+    def command(self, path):
         raise NotImplementedError()
 
 
 class SimpleEngine(Engine):
-    def __init__(self, name, command_to_prepend):
+    def __init__(self, name, command_to_prepend, artifacts=[]):
         self.name = name
-        self.command_to_prepend = command_to_prepend
+        # May contain Artifacts, resolved to their path only when a command
+        # is needed, so that steps running no engine hash no sources
+        self._command_to_prepend = command_to_prepend
+        # Artifacts to build before running the engine
+        self.artifacts = artifacts
+
+    @property
+    def command_to_prepend(self):
+        return [
+            part.path if isinstance(part, Artifact) else part
+            for part in self._command_to_prepend
+        ]
 
     def command(self, path):
         return self.command_to_prepend + [path]
 
-    def __call__(self, runner, path):
-        runner.run_command(self.command(path))
 
+def wasmkit_variants(threading_models, compilation_modes, stack_sizes):
+    """Expand the given WasmKit configuration axes into (name, options) pairs.
+
+    An axis left as None is not passed to `wasmkit-cli` and does not appear in
+    the variant name, so no axis at all yields the plain "WasmKit" engine.
+    """
+    import itertools
+
+    axes = [
+        (threading_models, lambda v: v, "--threading-model"),
+        (compilation_modes, lambda v: v, "--compilation-mode"),
+        (stack_sizes, lambda v: f"stack={v}", "--stack-size"),
+    ]
+    axes = [(values, label, option) for values, label, option in axes if values]
+    if not axes:
+        return [("WasmKit", [])]
 
-def available_engines():
+    variants = []
+    for combination in itertools.product(*[values for values, _, _ in axes]):
+        labels = []
+        options = []
+        for value, (_, label, option) in zip(combination, axes):
+            labels.append(label(value))
+            options += [option, str(value)]
+        variants.append((f"WasmKit[{','.join(labels)}]", options))
+    return variants
+
+
+def available_engines(threading_models=None, compilation_modes=None, stack_sizes=None,
+                      builds=None):
     engines = {}
 
     def add_engine(engine):
         engines[engine.name] = engine
 
-    add_engine(SimpleEngine("WasmKit", [
-        os.path.join(SOURCE_ROOT, ".build/release/wasmkit-cli"), "run",
-    ]))
+    for build_name, wasmkit_cli in builds or wasmkit_builds(None, None):
+        artifacts = []
+        if isinstance(wasmkit_cli, Artifact):
+            artifacts = [wasmkit_cli]
+        for name, options in wasmkit_variants(threading_models, compilation_modes, stack_sizes):
+            # "WasmKit[direct]" -> "WasmKit@main[direct]"
+            name = build_name + name[len("WasmKit"):]
+            add_engine(SimpleEngine(name, [wasmkit_cli, "run"] + options, artifacts))
 
     if shutil.which("wasmtime"):
         add_engine(SimpleEngine("wasmtime", ["wasmtime", "run", "-C", "cache=n"]))
@@ -43,22 +318,91 @@ def available_engines():
     return engines
 
 
+@dataclass
+class Job:
+    """A single (target, engine) measurement scheduled by the Runner."""
+    benchmark: str
+    engine_name: str
+    target: str
+    command: list
+    warmup: int
+    min_runs: int
+    min_time: float
+    max_runs: int = None
+    # Print the output of the last run, e.g. for scores reported by the guest
+    show_output: bool = False
+    # Called with the output of each run to extract extra per-run metrics
+    output_parser: object = None
+    # Keep measuring runs that exit with a non-zero status, e.g. guest traps
+    allow_failure: bool = False
+    # Called instead of measuring `command` for harnesses that measure by
+    # themselves; returns {target: result fields} with at least "runs"
+    collect: object = None
+
+
 @dataclass
 class Benchmark:
     name: str
     eta_sec: float
+    warmup: int = 5
+    min_runs: int = 10
+    min_time: float = 3.0
+
+    # Artifacts to build before running the benchmark
+    artifacts = []
+    # Only run when selected with --benchmark
+    opt_in = False
+
+    def job(self, engine_name, target, command, **kwargs):
+        return Job(self.name, engine_name, os.path.basename(target), command,
+                   warmup=self.warmup, min_runs=self.min_runs,
+                   min_time=self.min_time, **kwargs)
+
+    def report(self, runner):
+        """Print a benchmark-specific report after all jobs have run."""
+        pass
+
+
+def parse_coremark_score(output):
+    """Extract the score CoreMark reports, also as seconds per iteration.
+
+    CoreMark iterates until it has run long enough by itself, so its wall
+    time is about the same on every engine and only the score tells them
+    apart.
+    """
+    import re
+
+    match = re.search(r"Iterations/Sec\s*:\s*([\d.]+)", output)
+    if match is None:
+        raise ValueError("CoreMark did not report its Iterations/Sec")
+    iterations_per_second = float(match.group(1))
+    return {
+        "iterations_per_second": iterations_per_second,
+        "iteration_seconds": 1 / iterations_per_second,
+    }
+
+
+def run_time(run):
+    """The time of a run that results are compared by; lower is better."""
+    return run.get("iteration_seconds", run["wall"])
 
 
 class CoreMarkBenchmark(Benchmark):
     def __init__(self):
-        super().__init__("CoreMark", 20.0)
-        self.path = os.path.join(
-            SOURCE_ROOT, "Vendor", "coremark", "coremark.wasm")
+        # CoreMark iterates until it has run long enough by itself
+        super().__init__("CoreMark", 20.0, warmup=0, min_runs=1, min_time=0.0)
+        self.artifacts = [ARTIFACTS["coremark"]]
 
-    def __call__(self, runner, engines):
-        for engine_name, engine in engines.items():
-            print(f"===== Running {self.name} with {engine_name} =====")
-            engine(runner, self.path)
+    @property
+    def path(self):
+        return ARTIFACTS["coremark"].path
+
+    def jobs(self, runner, engines):
+        return [
+            self.job(engine_name, self.path, engine.command(self.path),
+                     show_output=True, output_parser=parse_coremark_score)
+            for engine_name, engine in engines.items()
+        ]
 
 
 class WishYouWereFastBenchmark(Benchmark):
@@ -80,51 +424,810 @@ class WishYouWereFastBenchmark(Benchmark):
         add_dir("libsodium")
         self.targets = sorted(targets)
 
-    def __call__(self, runner, engines):
-        # Save the result CSV file at ./results/{engine_name}/{target_name}.csv
-        results_dir = runner.results_dir
-
-        for i, target in enumerate(self.targets):
+    def jobs(self, runner, engines):
+        jobs = []
+        for target in self.targets:
             for engine_name, engine in engines.items():
-                runner.run_command([
-                    "mkdir", "-p", os.path.join(results_dir, engine.name)])
-                print(f"===== Running {i+1}/{len(self.targets)}: {target} with {engine_name} =====")
                 if not isinstance(engine, SimpleEngine):
                     raise NotImplementedError(
                         "WishYouWereFastBenchmark only supports SimpleEngine")
+                jobs.append(self.job(engine_name, target, engine.command(target)))
+        return jobs
+
+
+def add_variant_label(engine_name, label):
+    """Append a label to a variant name, e.g. "WasmKit[direct]" -> "WasmKit[direct,lazy]"."""
+    if engine_name.endswith("]"):
+        return f"{engine_name[:-1]},{label}]"
+    return f"{engine_name}[{label}]"
+
+
+def leb128(value):
+    """Encode an unsigned integer in LEB128."""
+    encoded = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            encoded.append(byte | 0x80)
+        else:
+            encoded.append(byte)
+            return bytes(encoded)
+
+
+def wasm_vector(items):
+    return leb128(len(items)) + b"".join(items)
+
+
+def wasm_section(section_id, payload):
+    return bytes([section_id]) + leb128(len(payload)) + payload
 
-                csv_path = os.path.join(
-                    results_dir, engine.name, os.path.basename(target) + ".csv")
-                command = engine.command(target)
-                command = [
-                    "hyperfine", "--warmup", "5", "--export-csv", csv_path,
-                    " ".join(command)
+
+def synthesize_module(num_functions, body_size):
+    """Build a module exporting an empty `_start` and never-called functions.
+
+    Eager compilation translates all of the functions at instantiation while
+    lazy compilation translates none, so the difference is compile time.
+    """
+    types = wasm_vector([
+        b"\x60\x00\x00",  # () -> ()
+        b"\x60\x01\x7f\x01\x7f",  # (i32) -> i32
+    ])
+    functions = wasm_vector([leb128(0)] + [leb128(1)] * num_functions)
+    # "_start" exporting function 0
+    exports = wasm_vector([leb128(6) + b"_start" + b"\x00\x00"])
+    # local.get 0, then `i32.const 1; i32.add` body_size times
+    body = b"\x00\x20\x00" + b"\x41\x01\x6a" * body_size + b"\x0b"
+    bodies = [b"\x00\x0b"] + [body] * num_functions
+    code = wasm_vector([leb128(len(b)) + b for b in bodies])
+    return (b"\x00asm\x01\x00\x00\x00"
+            + wasm_section(1, types) + wasm_section(3, functions)
+            + wasm_section(7, exports) + wasm_section(10, code))
+
+
+def parse_wasmkit_phases(output):
+    """Extract the phase times logged by `wasmkit-cli run --verbose`."""
+    import re
+
+    phases = {}
+    patterns = {
+        "parse": r"Finished parsing module: ([0-9.e+-]+) seconds",
+        "invoke": r"Finished invoking function \".*\": ([0-9.e+-]+) seconds",
+    }
+    for phase, pattern in patterns.items():
+        match = re.search(pattern, output)
+        if match:
+            phases[phase] = float(match.group(1))
+        # A missing phase would silently report a zero column
+        if not phases.get(phase):
+            raise ValueError(
+                f"wasmkit-cli --verbose did not report the {phase} time:\n{output}")
+    return phases
+
+
+class StartupBenchmark(Benchmark):
+    """Startup cost of WasmKit by phase over modules of increasing size.
+
+    Every module runs with both eager and lazy compilation. Times are reported
+    relative to an empty module, split into parse, compile (eager minus lazy
+    instantiation and invocation), execute (lazy invocation) and the rest of
+    the process lifetime.
+    """
+
+    COMPILATION_MODES = ["eager", "lazy"]
+    # (number of functions, instructions per function)
+    SYNTHETIC_SIZES = [(10, 100), (100, 100), (1000, 100), (10000, 100)]
+
+    def __init__(self):
+        super().__init__("Startup", 30.0, warmup=3, min_runs=20, min_time=1.0)
+        self.corpus_dir = os.path.join(SOURCE_ROOT, ".build", "bench", "startup")
+        self.baseline = os.path.join(self.corpus_dir, "empty.wasm")
+        self.targets = [self.baseline] + [
+            os.path.join(self.corpus_dir, f"funcs{n}-insts{size}.wasm")
+            for n, size in self.SYNTHETIC_SIZES
+        ] + [os.path.join(SOURCE_ROOT, "Benchmarks", "wasm", "local.wasm")]
+        # Engine name -> (WasmKit engine name, compilation mode)
+        self.variants = {}
+
+    def generate_corpus(self):
+        os.makedirs(self.corpus_dir, exist_ok=True)
+        modules = [(self.baseline, 0, 0)] + [
+            (path, n, size)
+            for path, (n, size) in zip(self.targets[1:], self.SYNTHETIC_SIZES)
+        ]
+        for path, n, size in modules:
+            with open(path, "wb") as f:
+                f.write(synthesize_module(n, size))
+
+    def jobs(self, runner, engines):
+        if not runner.dry_run:
+            self.generate_corpus()
+
+        jobs = []
+        for engine_name, engine in engines.items():
+            if not engine_name.startswith("WasmKit"):
+                continue
+            modes = self.COMPILATION_MODES
+            if "--compilation-mode" in engine.command_to_prepend:
+                # The variant already fixes the mode
+                modes = [None]
+            for mode in modes:
+                name = engine_name
+                options = ["--verbose"]
+                if mode is not None:
+                    name = add_variant_label(engine_name, mode)
+                    options += ["--compilation-mode", mode]
+                self.variants[name] = (engine_name, mode)
+                for target in self.targets:
+                    jobs.append(self.job(
+                        name, target, engine.command_to_prepend + options + [target],
+                        output_parser=parse_wasmkit_phases))
+        return jobs
+
+    def report(self, runner):
+        import csv
+        import statistics
+
+        results = {
+            (result["engine"], result["target"]): result
+            for result in load_results(runner.results_dir)
+            if result["benchmark"] == self.name
+        }
+
+        def phase_means(name, target):
+            result = results.get((name, os.path.basename(target)))
+            if result is None:
+                return None
+            runs = result["runs"]
+            means = {
+                key: statistics.mean(run.get(key, 0.0) for run in runs)
+                for key in ["wall", "parse", "invoke"]
+            }
+            means["process"] = means["wall"] - means["parse"] - means["invoke"]
+            return means
+
+        rows = []
+        for name, (engine_name, mode) in self.variants.items():
+            baseline = phase_means(name, self.baseline)
+            if baseline is None:
+                continue
+            for target in self.targets[1:]:
+                means = phase_means(name, target)
+                if means is None:
+                    continue
+                row = {
+                    "engine": engine_name, "mode": mode or "",
+                    "target": os.path.basename(target),
+                    "size": os.path.getsize(target),
+                }
+                for key in ["wall", "parse", "invoke", "process"]:
+                    row[key] = means[key] - baseline[key]
+                rows.append(row)
+
+        # Compile cost is what eager compilation adds over lazy for the same module
+        lazy_invoke = {
+            (row["engine"], row["target"]): row["invoke"]
+            for row in rows if row["mode"] == "lazy"
+        }
+        for row in rows:
+            lazy = lazy_invoke.get((row["engine"], row["target"]))
+            row["compile"] = "" if lazy is None else row["invoke"] - lazy
+            row["execute"] = "" if lazy is None else lazy
+
+        rows.sort(key=lambda row: (row["engine"], row["mode"], row["size"]))
+        columns = ["engine", "mode", "target", "size", "wall", "parse",
+                   "compile", "execute", "invoke", "process"]
+        with open(os.path.join(runner.results_dir, "startup.csv"), "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(rows)
+
+        def ms(value):
+            return f"{value * 1000:>9.3f}" if value != "" else f"{'-':>9}"
+
+        print("===== Startup cost over empty.wasm (ms) =====")
+        print(f"{'engine':<24} {'mode':<6} {'target':<24} {'bytes':>9}"
+              f" {'total':>9} {'parse':>9} {'compile':>9} {'execute':>9} {'process':>9}")
+        for row in rows:
+            print(f"{row['engine']:<24} {row['mode']:<6} {row['target']:<24} {row['size']:>9}"
+                  f" {ms(row['wall'])} {ms(row['parse'])} {ms(row['compile'])}"
+                  f" {ms(row['execute'])} {ms(row['process'])}")
+
+
+class FuzzSlowInputsBenchmark(Benchmark):
+    """Modules that differential fuzzing found WasmKit to run slowly.
+
+    `FuzzTesting/differential.py` keeps wasm-smith modules that run far slower
+    on WasmKit than on the reference engine, together with the function it
+    invoked. Each is replayed by invoking that function with zeros, and the
+    report compares the ratio to wasmtime with the one seen while fuzzing.
+    """
+
+    CORPUS_DIR = os.path.join(
+        SOURCE_ROOT, "FuzzTesting", "FailCases", "FuzzDifferential-slow")
+    # Parameter types that both wasmkit-cli and wasmtime can parse
+    PARAMETER_TYPES = {"i32", "i64", "f32", "f64"}
+
+    def __init__(self):
+        super().__init__("FuzzSlowInputs", 10.0, warmup=1, min_runs=5, min_time=1.0)
+        self.inputs = []
+        index_path = self.CORPUS_DIR + ".index.json"
+        if os.path.exists(index_path):
+            import json
+            with open(index_path) as f:
+                self.inputs = [
+                    entry for entry in json.load(f)
+                    if "entry" in entry
+                    and set(entry["entry"]["params"]) <= self.PARAMETER_TYPES
                 ]
-                runner.run_command(command)
+
+    def command(self, engine_name, engine, target, entry):
+        function, params = entry["function"], entry["params"]
+        if engine_name.startswith("WasmKit"):
+            return engine.command_to_prepend + [target, function] + [
+                f"{param}:0" for param in params]
+        if engine_name == "wasmtime":
+            return engine.command_to_prepend + [
+                "--invoke", function, target] + ["0"] * len(params)
+        return None
+
+    def jobs(self, runner, engines):
+        jobs = []
+        for entry in self.inputs:
+            target = os.path.join(self.CORPUS_DIR, entry["file"])
+            for engine_name, engine in engines.items():
+                command = self.command(engine_name, engine, target, entry["entry"])
+                if command is not None:
+                    jobs.append(self.job(engine_name, target, command,
+                                         allow_failure=True))
+        return jobs
+
+    def report(self, runner):
+        import statistics
+
+        medians = {
+            (result["engine"], result["target"]):
+                statistics.median(run["wall"] for run in result["runs"])
+            for result in load_results(runner.results_dir)
+            if result["benchmark"] == self.name
+        }
+        if not any(engine == "wasmtime" for engine, _ in medians):
+            return
+        engine_names = sorted({
+            engine for engine, _ in medians if engine.startswith("WasmKit")})
+        print("===== WasmKit/wasmtime wall time ratio of slow fuzz inputs =====")
+        print(f"{'target':<52} {'fuzzing':>8}" +
+              "".join(f" {name:>16}" for name in engine_names))
+        for entry in self.inputs:
+            reference = medians.get(("wasmtime", entry["file"]))
+            if reference is None:
+                continue
+            ratios = []
+            for name in engine_names:
+                median = medians.get((name, entry["file"]))
+                ratios.append(f"{median / reference:>15.1f}x"
+                              if median is not None else f"{'-':>16}")
+            print(f"{entry['file']:<52} {entry['ratio']:>7.1f}x " + " ".join(ratios))
+
+
+def parse_wasi_io_stats(output):
+    """Extract the I/O the guest of WasiIOBenchmark timed by itself."""
+    import re
+
+    match = re.search(r"wasi-io: bytes=(\d+) ops=(\d+) seconds=([\d.]+)", output)
+    if match is None:
+        return {}
+    return {
+        "io_bytes": int(match.group(1)),
+        "io_ops": int(match.group(2)),
+        "io_seconds": float(match.group(3)),
+    }
+
+
+class WasiIOBenchmark(Benchmark):
+    """Throughput of WASI file system calls.
+
+    A guest built with wasi-sdk runs I/O workloads in a preopened directory on
+    tmpfs, so that the time goes to the WASI layer of the engine rather than
+    to the disk. The guest times the I/O itself, leaving out the preparation
+    of its files, and the report gives MB/s and WASI calls per second.
+    """
+
+    WORKLOADS = ["seq-write", "seq-read", "rand-read", "rand-write", "dir-walk", "small-writes"]
+    GUEST_DIR = "/data"
+
+    def __init__(self):
+        super().__init__("WasiIO", 60.0, warmup=1, min_runs=5, min_time=1.0)
+        self.artifacts = [ARTIFACTS["wasi-io"]]
+        import tempfile
+        tmpfs = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        self.io_root = os.path.join(tmpfs, "wasmkit-bench-wasi-io")
+
+    def command(self, engine_name, engine, directory, workload):
+        # Only engines that can map a host directory to a guest path
+        if not (engine_name.startswith("WasmKit") or engine_name == "wasmtime"):
+            return None
+        path = ARTIFACTS["wasi-io"].path
+        return engine.command_to_prepend + [
+            "--dir", f"{directory}::{self.GUEST_DIR}", path, workload, self.GUEST_DIR]
+
+    def jobs(self, runner, engines):
+        jobs = []
+        for workload in self.WORKLOADS:
+            for i, (engine_name, engine) in enumerate(engines.items()):
+                # Each pair gets its own directory as pairs may run concurrently
+                directory = os.path.join(self.io_root, f"{workload}-{i}")
+                command = self.command(engine_name, engine, directory, workload)
+                if command is None:
+                    continue
+                if not runner.dry_run:
+                    os.makedirs(directory, exist_ok=True)
+                jobs.append(self.job(engine_name, f"wasi-io-{workload}", command,
+                                     output_parser=parse_wasi_io_stats))
+        return jobs
+
+    def report(self, runner):
+        import csv
+
+        rows = []
+        for result in load_results(runner.results_dir):
+            if result["benchmark"] != self.name:
+                continue
+            runs = [run for run in result["runs"] if "io_seconds" in run]
+            seconds = sum(run["io_seconds"] for run in runs)
+            if not seconds:
+                continue
+            rows.append({
+                "engine": result["engine"], "target": result["target"],
+                "mb_per_sec": sum(run["io_bytes"] for run in runs) / seconds / 1e6,
+                "ops_per_sec": sum(run["io_ops"] for run in runs) / seconds,
+            })
+        if not rows:
+            return
+        rows.sort(key=lambda row: (row["target"], row["engine"]))
+        with open(os.path.join(runner.results_dir, "wasi_io.csv"), "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["engine", "target", "mb_per_sec", "ops_per_sec"])
+            writer.writeheader()
+            writer.writerows(rows)
+
+        print("===== WASI I/O throughput =====")
+        print(f"{'target':<24} {'engine':<24} {'MB/s':>10} {'calls/s':>12}")
+        for row in rows:
+            # Directory walks move no file data
+            mb_per_sec = f"{row['mb_per_sec']:>10.1f}" if row["mb_per_sec"] else f"{'-':>10}"
+            print(f"{row['target']:<24} {row['engine']:<24}"
+                  f" {mb_per_sec} {row['ops_per_sec']:>12.0f}")
+
+
+# Time units of the JMH export of package-benchmark, in seconds
+JMH_TIME_UNITS = {"s": 1.0, "ms": 1e-3, "μs": 1e-6, "us": 1e-6, "ns": 1e-9}
+
+
+def parse_jmh_results(path, target):
+    """Convert a JMH export of package-benchmark into bench.py result fields.
+
+    Every benchmark becomes a target named "<target>:<benchmark>" whose runs
+    are the recorded wall clock samples. The other metrics, such as
+    throughput and mallocs, are kept as their score and percentiles.
+    """
+    import json
+
+    def metric_fields(metric):
+        return {
+            "unit": metric["scoreUnit"],
+            "score": metric["score"],
+            "percentiles": metric.get("scorePercentiles", {}),
+        }
+
+    with open(path) as f:
+        elements = json.load(f)
+    results = {}
+    for element in elements:
+        name = element["benchmark"].removeprefix("package.benchmark.")
+        name = name.removeprefix(target + ".")
+        wall = element["primaryMetric"]
+        scale = JMH_TIME_UNITS.get(wall["scoreUnit"].split("/")[0].strip())
+        if scale is None:
+            raise ValueError(f"Unknown wall clock unit '{wall['scoreUnit']}' in {path}")
+        samples = [value for fork in wall.get("rawData", []) for value in fork]
+        metrics = {"Time (wall clock)": metric_fields(wall)}
+        for metric_name, metric in (element.get("secondaryMetrics") or {}).items():
+            metrics[metric_name] = metric_fields(metric)
+        # Benchmark names may be file names, which must not nest directories
+        results[f"{target}:{name}".replace("/", "_")] = {
+            "runs": [
+                {"run": i, "wall": value * scale}
+                for i, value in enumerate(samples)
+            ],
+            "metrics": metrics,
+        }
+    return results
+
+
+class LibraryBenchmark(Benchmark):
+    """The package-benchmark targets under Benchmarks/Benchmarks.
+
+    They measure WasmKit as a library from within the process, e.g. the
+    instantiation, parsing, and execution of a module, and are run with
+    `swift package benchmark`. Their JMH export is converted into the same
+    results as the end-to-end runs, attributed to the plain "WasmKit" engine
+    since they always build the checked out tree.
+    """
+
+    PACKAGE_DIR = os.path.join(SOURCE_ROOT, "Benchmarks")
+    # `swift package benchmark` runs its own threads on the single CPU a job
+    # is pinned to, so it is not run by default
+    opt_in = True
+
+    def __init__(self):
+        super().__init__("Library", 120.0)
+        # Build the benchmark executables ahead of the pinned jobs, which
+        # then find them up to date and only measure
+        self.artifacts = [Artifact(
+            "benchmarks-package",
+            os.path.join(self.PACKAGE_DIR, ".build", "release"),
+            lambda: [[
+                "swift", "build", "-c", "release", "--package-path", self.PACKAGE_DIR,
+            ]],
+            inputs=[], cache=False,
+        )]
+        targets_dir = os.path.join(self.PACKAGE_DIR, "Benchmarks")
+        self.targets = sorted(
+            name for name in os.listdir(targets_dir)
+            if os.path.isdir(os.path.join(targets_dir, name)))
+
+    def command(self, target, export_dir):
+        return [
+            "swift", "package", "--package-path", self.PACKAGE_DIR,
+            "--allow-writing-to-directory", export_dir,
+            "benchmark", "--target", target,
+            "--format", "jmh", "--path", export_dir,
+        ]
+
+    def collect(self, job, log_path):
+        import glob
+        import tempfile
+
+        results = {}
+        with tempfile.TemporaryDirectory(prefix="bench-jmh-") as export_dir:
+            with open(log_path, "w") as log:
+                subprocess.check_call(
+                    self.command(job.target, export_dir),
+                    stdout=log, stderr=subprocess.STDOUT)
+            for path in sorted(glob.glob(os.path.join(export_dir, "*.jmh.json"))):
+                results.update(parse_jmh_results(path, job.target))
+        if not results:
+            raise RuntimeError(f"No JMH export of {job.target}; see {log_path}")
+        return results
+
+    def jobs(self, runner, engines):
+        if runner.profile:
+            print(f"===== Skipping {self.name}: it cannot be profiled =====")
+            return []
+        if "WasmKit" not in engines:
+            print(f"===== Skipping {self.name}: it only runs with the WasmKit engine =====")
+            return []
+        return [
+            self.job("WasmKit", target, self.command(target, "<export-dir>"),
+                     collect=self.collect)
+            for target in self.targets
+        ]
+
+    def report(self, runner):
+        results = [
+            result for result in load_results(runner.results_dir)
+            if result["benchmark"] == self.name
+        ]
+        if not results:
+            return
+
+        def percentile(metric, p):
+            if metric is None:
+                return f"{'-':>12}"
+            value = metric["percentiles"].get(p)
+            return f"{value:>12.6g}" if value is not None else f"{'-':>12}"
+
+        print("===== Library benchmarks (p50 / p99 wall clock, p50 throughput and mallocs) =====")
+        print(f"{'target':<48} {'unit':>5} {'p50':>12} {'p99':>12}"
+              f" {'throughput':>12} {'mallocs':>12}")
+        for result in sorted(results, key=lambda result: result["target"]):
+            metrics = result.get("metrics", {})
+            wall = metrics["Time (wall clock)"]
+            throughput = next((metric for name, metric in metrics.items()
+                               if name.startswith("Throughput")), None)
+            mallocs = metrics.get("Malloc (total)")
+            print(f"{result['target']:<48} {wall['unit']:>5}"
+                  f" {percentile(wall, '50.0')} {percentile(wall, '99.0')}"
+                  f" {percentile(throughput, '50.0')} {percentile(mallocs, '50.0')}")
 
 
 def available_benchmarks():
     benchmarks = [
         CoreMarkBenchmark(),
         WishYouWereFastBenchmark(),
+        StartupBenchmark(),
+        FuzzSlowInputsBenchmark(),
+        LibraryBenchmark(),
+        WasiIOBenchmark(),
     ]
     return {b.name: b for b in benchmarks}
 
 
+def match_engine(name, pattern):
+    import fnmatch
+    return fnmatch.fnmatchcase(name, pattern.replace("[", "[[]"))
+
+
+def filter_engines(engines, patterns):
+    """Select engines whose name matches any of the given glob patterns.
+
+    Only `*` and `?` are wildcards; brackets match literally so that variant
+    names like "WasmKit[direct,lazy]" can be written as they are printed.
+    """
+    if patterns is None:
+        return engines
+    selected = {}
+    for pattern in patterns:
+        matched = [name for name in engines if match_engine(name, pattern)]
+        if not matched:
+            raise ValueError(
+                f"No engine matches '{pattern}'; available: {', '.join(engines)}")
+        for name in matched:
+            selected[name] = engines[name]
+    return selected
+
+
+def max_rss_bytes(rusage):
+    # ru_maxrss is in bytes on macOS but in kilobytes elsewhere
+    if sys.platform == "darwin":
+        return rusage.ru_maxrss
+    return rusage.ru_maxrss * 1024
+
+
+def spawn_and_wait(command, log_path, check=True):
+    """Run the command once and measure it with the rusage from wait4.
+
+    The output goes to `log_path`, overwritten on every run. A non-zero exit
+    status raises CalledProcessError unless `check` is False.
+    """
+    import time
+
+    file_actions = [
+        (os.POSIX_SPAWN_OPEN, 0, os.devnull, os.O_RDONLY, 0),
+        (os.POSIX_SPAWN_OPEN, 1, log_path,
+         os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644),
+        (os.POSIX_SPAWN_DUP2, 1, 2),
+    ]
+    start = time.perf_counter()
+    pid = os.posix_spawnp(command[0], command, os.environ, file_actions=file_actions)
+    _, status, rusage = os.wait4(pid, 0)
+    wall = time.perf_counter() - start
+
+    exit_code = os.waitstatus_to_exitcode(status)
+    if check and exit_code != 0:
+        raise subprocess.CalledProcessError(exit_code, command)
+    return {
+        "wall": wall,
+        "user": rusage.ru_utime,
+        "system": rusage.ru_stime,
+        "max_rss": max_rss_bytes(rusage),
+        "minor_faults": rusage.ru_minflt,
+        "major_faults": rusage.ru_majflt,
+        "voluntary_switches": rusage.ru_nvcsw,
+        "involuntary_switches": rusage.ru_nivcsw,
+    }
+
+
+def measure(job, log_path):
+    """Measure the job's command like hyperfine does.
+
+    After `warmup` discarded runs, keep running until both `min_runs` runs
+    and `min_time` seconds have been spent, but no more than `max_runs`.
+    """
+    import time
+
+    check = not job.allow_failure
+    for _ in range(job.warmup):
+        spawn_and_wait(job.command, log_path, check)
+
+    runs = []
+    start = time.perf_counter()
+    while len(runs) < job.min_runs or time.perf_counter() - start < job.min_time:
+        if job.max_runs is not None and len(runs) >= job.max_runs:
+            break
+        run = spawn_and_wait(job.command, log_path, check)
+        run["run"] = len(runs)
+        if job.output_parser is not None:
+            with open(log_path) as log:
+                run.update(job.output_parser(log.read()))
+        runs.append(run)
+    return runs
+
+
+def summarize_runs(runs):
+    import statistics
+
+    walls = [run["wall"] for run in runs]
+    stddev = statistics.stdev(walls) if len(walls) > 1 else 0.0
+    if "max_rss" not in runs[0]:
+        # Samples collected by an in-process harness have no rusage
+        return (f"{statistics.mean(walls) * 1e6:.3f} µs ± {stddev * 1e6:.3f} µs"
+                f" ({len(runs)} samples)")
+    max_rss = max(run["max_rss"] for run in runs)
+    return (f"{statistics.mean(walls):.3f} s ± {stddev:.3f} s"
+            f" (user {statistics.mean(run['user'] for run in runs):.3f} s,"
+            f" system {statistics.mean(run['system'] for run in runs):.3f} s,"
+            f" max RSS {max_rss / (1024 * 1024):.1f} MiB,"
+            f" {statistics.mean(run['minor_faults'] for run in runs):.0f} minor /"
+            f" {statistics.mean(run['major_faults'] for run in runs):.0f} major faults,"
+            f" {len(runs)} runs)")
+
+
+def result_path(results_dir, engine_name, target):
+    return os.path.join(results_dir, engine_name, target + ".json")
+
+
+def iter_trace_events(path, chunk_size=1 << 20):
+    """Yield the events of a Trace Event Format array without loading it all.
+
+    A truncated last event, e.g. from a guest that trapped before the
+    profiler was finalized, is ignored.
+    """
+    import json
+
+    decoder = json.JSONDecoder()
+    separators = " \t\r\n,[]"
+    buffer = ""
+    pos = 0
+    eof = False
+    with open(path) as f:
+        while True:
+            while pos < len(buffer) and buffer[pos] in separators:
+                pos += 1
+            if pos < len(buffer):
+                try:
+                    event, pos = decoder.raw_decode(buffer, pos)
+                    yield event
+                    continue
+                except json.JSONDecodeError:
+                    if eof:
+                        return
+            elif eof:
+                return
+            # Drop the consumed part and read more
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+
+
+class TraceProfile:
+    """Per-function self and inclusive time aggregated from begin/end events."""
+
+    def __init__(self):
+        # name -> [calls, self time, inclusive time] in microseconds
+        self.functions = {}
+        # "outer;inner" -> self time in microseconds
+        self.stacks = {}
+        # [name, begin timestamp, time spent in callees]
+        self.frames = []
+        self.active = {}
+
+    def add(self, event):
+        phase = event.get("ph")
+        # Semicolons separate frames in the collapsed stack format
+        name = event.get("name", "").replace(";", ":")
+        if phase == "B":
+            self.frames.append([name, event["ts"], 0])
+            self.active[name] = self.active.get(name, 0) + 1
+        elif phase == "E" and self.active.get(name):
+            # Unwind frames left open by traps until the matching one
+            while self.frames:
+                frame_name, begin, callee_time = self.frames[-1]
+                self.finish_frame(event["ts"] - begin, callee_time)
+                if frame_name == name:
+                    break
+
+    def finish_frame(self, inclusive, callee_time):
+        stack = ";".join(frame[0] for frame in self.frames)
+        name, _, _ = self.frames.pop()
+        self.active[name] -= 1
+        stats = self.functions.setdefault(name, [0, 0, 0])
+        stats[0] += 1
+        stats[1] += inclusive - callee_time
+        # Count recursive calls only once in the inclusive time
+        if self.active[name] == 0:
+            stats[2] += inclusive
+        self.stacks[stack] = self.stacks.get(stack, 0) + inclusive - callee_time
+        if self.frames:
+            self.frames[-1][2] += inclusive
+
+    def sorted_functions(self):
+        return sorted(self.functions.items(), key=lambda item: item[1][1], reverse=True)
+
+    def format_top(self, count):
+        total = sum(stats[1] for stats in self.functions.values()) or 1
+        lines = [f"{'self %':>7} {'self ms':>10} {'incl ms':>10} {'calls':>10}  function"]
+        for name, (calls, self_time, inclusive) in self.sorted_functions()[:count]:
+            lines.append(f"{self_time / total:>7.1%} {self_time / 1000:>10.3f}"
+                         f" {inclusive / 1000:>10.3f} {calls:>10}  {name}")
+        return "\n".join(lines) + "\n"
+
+    def write_functions_csv(self, path):
+        import csv
+
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["function", "calls", "self_us", "inclusive_us"])
+            for name, (calls, self_time, inclusive) in self.sorted_functions():
+                writer.writerow([name, calls, self_time, inclusive])
+
+    def write_folded(self, path):
+        with open(path, "w") as f:
+            for stack, self_time in sorted(self.stacks.items()):
+                f.write(f"{stack} {self_time}\n")
+
+
+def parse_cpu_list(value):
+    """Parse a CPU list like "2-5,8" into a list of CPU numbers."""
+    cpus = []
+    for part in value.split(","):
+        if "-" in part:
+            first, last = part.split("-", 1)
+            cpus += range(int(first), int(last) + 1)
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def available_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def interleave_engines(jobs):
+    """Rotate the engine order for each target.
+
+    Running the engines in the same order for every target would let
+    thermal throttling and frequency drift consistently favor the first one.
+    """
+    groups = {}
+    for job in jobs:
+        groups.setdefault((job.benchmark, job.target), []).append(job)
+    ordered = []
+    for i, group in enumerate(groups.values()):
+        shift = i % len(group)
+        ordered += group[shift:] + group[:shift]
+    return ordered
+
+
 class Runner:
 
     def __init__(self, args, engines, benchmarks):
         self.verbose = args.verbose
         self.dry_run = args.dry_run
         self.results_dir = args.results_dir
+        self.cpus = args.cpus or available_cpus()
+        self.jobs = args.jobs
+        self.profile = args.profile
+        self.profile_top = args.profile_top
+        self.keep_traces = args.keep_traces
+        # Measurement settings overriding the benchmarks' defaults
+        self.overrides = {
+            key: getattr(args, key)
+            for key in ["warmup", "min_runs", "min_time", "max_runs"]
+            if getattr(args, key) is not None
+        }
+        if self.jobs > len(self.cpus):
+            raise ValueError(
+                f"--jobs {self.jobs} exceeds the {len(self.cpus)} available CPUs")
 
-        def filter_dict(d, keys):
-            if keys is None:
-                return d
-            return {k: v for k, v in d.items() if k in keys}
-
-        self.engines = filter_dict(engines, args.engine)
-        self.benchmarks = filter_dict(benchmarks, args.benchmark)
+        self.engines = filter_engines(engines, args.engine)
+        if args.benchmark is None:
+            self.benchmarks = {k: v for k, v in benchmarks.items() if not v.opt_in}
+        else:
+            self.benchmarks = {k: v for k, v in benchmarks.items() if k in args.benchmark}
 
     def run_command(self, command):
         if self.verbose or self.dry_run:
@@ -132,85 +1235,627 @@ class Runner:
         if not self.dry_run:
             subprocess.check_call(command)
 
-    def build(self):
-        """Build .wasm file to benchmark."""
+    def build(self, force=False):
+        """Build the artifacts needed by the selected benchmarks and engines."""
+        artifacts = {}
+        for owner in list(self.benchmarks.values()) + list(self.engines.values()):
+            for artifact in getattr(owner, "artifacts", []):
+                # Revisions with identical inputs share one artifact
+                artifacts[artifact.cached_path] = artifact
+        for artifact in artifacts.values():
+            artifact.build(self, force=force)
 
-        wasi_sdk_path = os.getenv("WASI_SDK_PATH")
-        if wasi_sdk_path is None:
-            raise Exception("WASI_SDK_PATH environment variable not set")
+    def run(self):
+        engines = dict(sorted(self.engines.items(), key=lambda x: x[0]))
+        jobs = []
+        for benchmark_name, benchmark in self.benchmarks.items():
+            print(f"===== Scheduling {benchmark_name} (ETA: {benchmark.eta_sec} sec) =====")
+            jobs += interleave_engines(benchmark.jobs(self, engines))
+        for job in jobs:
+            for key, value in self.overrides.items():
+                setattr(job, key, value)
+        if self.profile:
+            self.run_jobs(jobs, self.profile_job)
+            return
+        self.run_jobs(jobs, self.measure_job)
+        if not self.dry_run:
+            for benchmark in self.benchmarks.values():
+                benchmark.report(self)
 
-        vendor_path = os.path.join(SOURCE_ROOT, "Vendor")
+    def run_jobs(self, jobs, execute):
+        """Run jobs concurrently, each holding one CPU exclusively.
 
-        self.run_command([
-            "make",
-            "compile", "-C", os.path.join(vendor_path, "coremark"),
-            "PORT_DIR=simple", f"CC={wasi_sdk_path}/bin/clang",
-            "PORT_CFLAGS=-O3 -D_WASI_EMULATED_PROCESS_CLOCKS -lwasi-emulated-process-clocks",
-            "EXE=.wasm"
-        ])
+        `execute(job, cpu)` is called on a worker thread pinned to the CPU
+        and returns the text to print when the job finishes.
+        """
+        import concurrent.futures
+        import queue
+        import threading
 
-        self.run_command([
-            "swift", "build", "-c", "release", "--package-path", SOURCE_ROOT, "--product", "wasmkit-cli"
-        ])
+        free_cpus = queue.Queue()
+        for cpu in self.cpus[:self.jobs]:
+            free_cpus.put(cpu)
+        lock = threading.Lock()
 
-    def run(self):
-        engines = dict(sorted(self.engines.items(), key=lambda x: x[0]))
-        for benchmark_name, benchmark in self.benchmarks.items():
-            print(f"===== Running {benchmark_name} (ETA: {benchmark.eta_sec} sec) =====")
-            benchmark(self, engines)
+        def run_job(index, job):
+            cpu = free_cpus.get()
+            try:
+                with lock:
+                    print(f"===== Running {index + 1}/{len(jobs)}: {job.benchmark}"
+                          f" {job.target} with {job.engine_name} on CPU {cpu} =====")
+                if not self.dry_run and hasattr(os, "sched_setaffinity"):
+                    # Pin this worker thread; spawned processes inherit its mask
+                    os.sched_setaffinity(0, {cpu})
+                output = execute(job, cpu)
+                if output:
+                    with lock:
+                        print(output, end="")
+            finally:
+                free_cpus.put(cpu)
 
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            futures = [
+                executor.submit(run_job, i, job) for i, job in enumerate(jobs)
+            ]
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    future.result()
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
 
-def concat_results(args):
+    def measure_job(self, job, cpu):
+        """Measure the job and write its runs to {results_dir}/{engine}/{target}.json.
+
+        The output of the last run is kept in {results_dir}/logs/{engine}/{target}.log.
+        A job that collects its own results writes one file per target it reports.
+        """
+        import json
+        import time
+
+        if self.verbose or self.dry_run:
+            print(f"+ {job.command} (warmup: {job.warmup},"
+                  f" min runs: {job.min_runs}, min time: {job.min_time} s)")
+        if self.dry_run:
+            return None
+
+        log_path = os.path.join(
+            self.results_dir, "logs", job.engine_name, job.target + ".log")
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        os.makedirs(os.path.join(self.results_dir, job.engine_name), exist_ok=True)
+
+        start = time.time()
+        if job.collect is not None:
+            results = job.collect(job, log_path)
+        else:
+            results = {job.target: {"runs": measure(job, log_path)}}
+        end = time.time()
+        output = ""
+        for target, fields in results.items():
+            output_path = result_path(self.results_dir, job.engine_name, target)
+            with open(output_path, "w") as f:
+                json.dump({
+                    "benchmark": job.benchmark, "engine": job.engine_name,
+                    "target": target, "command": job.command,
+                    "cpu": cpu, "start": start, "end": end, **fields,
+                }, f, indent=2)
+            output += (f"===== Finished {target} with {job.engine_name}:"
+                       f" {summarize_runs(fields['runs'])} =====\n")
+        if job.show_output:
+            with open(log_path) as log:
+                output += log.read()
+        return output
+
+    def profile_job(self, job, cpu):
+        """Run the job once with `--profile` and summarize the trace.
+
+        Writes {target}.functions.csv and {target}.folded (collapsed stacks
+        for flamegraph.pl or speedscope) under {results_dir}/profiles/{engine}/.
+        """
+        if os.path.basename(job.command[0]) != "wasmkit-cli":
+            return f"===== Skipping {job.engine_name}: profiling needs wasmkit-cli =====\n"
+
+        profile_dir = os.path.join(self.results_dir, "profiles", job.engine_name)
+        trace_path = os.path.join(profile_dir, job.target + ".trace.json")
+        # Insert the option right after the `run` subcommand
+        command = job.command[:2] + ["--profile", trace_path] + job.command[2:]
+        if self.verbose or self.dry_run:
+            print(f"+ {command}")
+        if self.dry_run:
+            return None
+
+        os.makedirs(profile_dir, exist_ok=True)
+        spawn_and_wait(command, os.path.join(profile_dir, job.target + ".log"))
+        profile = TraceProfile()
+        for event in iter_trace_events(trace_path):
+            profile.add(event)
+        if not self.keep_traces:
+            os.remove(trace_path)
+
+        profile.write_functions_csv(os.path.join(profile_dir, job.target + ".functions.csv"))
+        profile.write_folded(os.path.join(profile_dir, job.target + ".folded"))
+        return (f"===== Profile of {job.target} with {job.engine_name} =====\n"
+                + profile.format_top(self.profile_top))
+
+
+RUN_COLUMNS = [
+    "run", "wall", "user", "system", "max_rss", "minor_faults", "major_faults",
+    "voluntary_switches", "involuntary_switches", "iteration_seconds",
+]
+
+
+def load_results(results_dir):
+    """Load the result files written by Runner.run_jobs."""
     import glob
+    import json
 
-    results_dir = args.results_dir
     results = []
-    original_header = None
-    for csv_path in glob.glob(os.path.join(results_dir, "*/*.csv"), recursive=True):
-        engine_name = csv_path.split("/")[-2]
-        target_name = csv_path.split("/")[-1].replace(".csv", "")
-        with open(csv_path) as f:
-            lines = f.readlines()
-            if len(lines) == 1:
-                print(f"Warning: {csv_path} is empty")
-                continue
-            if original_header is None:
-                original_header = lines[0]
-            for line in lines[1:]:
-                results.append(f"{engine_name},{target_name},{line}")
+    # Escape the results directory so that it is not interpreted as a pattern
+    for json_path in sorted(glob.glob(os.path.join(glob.escape(results_dir), "*/*.json"))):
+        with open(json_path) as f:
+            result = json.load(f)
+        if not result.get("runs"):
+            print(f"Warning: {json_path} has no runs")
+            continue
+        results.append(result)
+    return results
+
+
+def concat_results(args):
+    import csv
+
+    results_dir = args.results_dir
+    rows = []
+    for result in load_results(results_dir):
+        for run in result["runs"]:
+            rows.append([
+                result["benchmark"], result["engine"], result["target"], result["cpu"]
+            ] + [run.get(column) for column in RUN_COLUMNS])
+
+    # Variant names like "WasmKit[direct,lazy]" contain commas, so let the
+    # csv module quote them.
+    with open(os.path.join(results_dir, "data.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["benchmark", "engine", "target", "cpu"] + RUN_COLUMNS)
+        writer.writerows(rows)
+
+
+def load_timings(results_dir, since=None):
+    """Load the per-run times of `run_time` keyed by (engine, target).
+
+    `since` skips results written before that time by earlier runs.
+    """
+    return {
+        (result["engine"], result["target"]): [run_time(run) for run in result["runs"]]
+        for result in load_results(results_dir)
+        if since is None or result["end"] >= since
+    }
+
+
+def median(values):
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2 == 1:
+        return values[mid]
+    return (values[mid - 1] + values[mid]) / 2
+
+
+def bootstrap_speedup(baseline, current, samples, confidence, rng):
+    """Bootstrap a confidence interval of median(baseline) / median(current)."""
+    ratios = []
+    for _ in range(samples):
+        b = median(rng.choices(baseline, k=len(baseline)))
+        c = median(rng.choices(current, k=len(current)))
+        ratios.append(b / c)
+    ratios.sort()
+    alpha = (1 - confidence) / 2
+    low = ratios[int(alpha * (samples - 1))]
+    high = ratios[int((1 - alpha) * (samples - 1))]
+    return low, high
+
+
+def mann_whitney_p(baseline, current):
+    """Two-sided p-value of the Mann-Whitney U test (normal approximation)."""
+    import math
+
+    n1, n2 = len(baseline), len(current)
+    combined = sorted(
+        [(v, 0) for v in baseline] + [(v, 1) for v in current],
+        key=lambda x: x[0])
+    # Assign average ranks to ties
+    ranks = [0.0] * len(combined)
+    tie_correction = 0.0
+    i = 0
+    while i < len(combined):
+        j = i
+        while j + 1 < len(combined) and combined[j + 1][0] == combined[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2 + 1
+        ties = j - i + 1
+        tie_correction += ties ** 3 - ties
+        i = j + 1
+    rank_sum = sum(r for r, (_, group) in zip(ranks, combined) if group == 0)
+    u = rank_sum - n1 * (n1 + 1) / 2
+    n = n1 + n2
+    variance = n1 * n2 / 12 * ((n + 1) - tie_correction / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0
+    z = (abs(u - n1 * n2 / 2) - 0.5) / math.sqrt(variance)
+    return min(1.0, math.erfc(max(z, 0.0) / math.sqrt(2)))
+
+
+def compare_timings(baseline, current, args):
+    """Compare two sets of timings keyed alike and print a table sorted by speedup.
+
+    Returns the number of regressed keys.
+    """
+    import random
+
+    rng = random.Random(0)
+
+    rows = []
+    for key in sorted(baseline.keys() & current.keys()):
+        base_times, cur_times = baseline[key], current[key]
+        speedup = median(base_times) / median(cur_times)
+        low, high = bootstrap_speedup(
+            base_times, cur_times, args.bootstrap_samples, args.confidence, rng)
+        p_value = mann_whitney_p(base_times, cur_times)
+        # Only flag regressions the whole confidence interval agrees on
+        regressed = high < 1 - args.regression_threshold
+        rows.append((key, speedup, low, high, p_value, regressed))
+
+    for key in sorted(baseline.keys() ^ current.keys()):
+        side = "baseline" if key in baseline else "current results"
+        print(f"Warning: {key[0]}/{key[1]} is only in the {side}")
+
+    rows.sort(key=lambda row: row[1])
+    header = f"{'engine':<24} {'target':<32} {'speedup':>8} {'CI':>17} {'p':>7}"
+    print(header)
+    print("-" * len(header))
+    for (engine_name, target_name), speedup, low, high, p_value, regressed in rows:
+        mark = "  REGRESSION" if regressed else ""
+        print(f"{engine_name:<24} {target_name:<32} {speedup:>7.3f}x"
+              f" [{low:.3f}, {high:.3f}] {p_value:>7.4f}{mark}")
+
+    return len([row for row in rows if row[5]])
+
+
+def compare_results(args):
+    """Compare the results against a baseline and return the exit status.
+
+    Nothing to compare is an error, so that a misspelled directory or
+    renamed targets cannot pass the gate.
+    """
+    baseline = load_timings(args.baseline_dir)
+    current = load_timings(args.results_dir)
+    for timings, directory in [(baseline, args.baseline_dir), (current, args.results_dir)]:
+        if not timings:
+            print(f"Error: no results in {directory}")
+            return 1
+    if not baseline.keys() & current.keys():
+        print(f"Error: no engine and target is in both {args.baseline_dir}"
+              f" and {args.results_dir}")
+        return 1
+    regressions = compare_timings(baseline, current, args)
+    if regressions:
+        print(f"{regressions} target(s) regressed by more than"
+              f" {args.regression_threshold:.1%}")
+        return 1
+    return 0
+
+
+def compare_wasmkit_builds(args, engine_names, since):
+    """Compare every WasmKit build against the first one measured in this run.
+
+    Results are paired by configuration variant and target, so that e.g.
+    "WasmKit@HEAD[lazy]" is compared with "WasmKit@main[lazy]".
+    """
+    timings = load_timings(args.results_dir, since)
+
+    def variant_timings(engine_name):
+        variants = {}
+        for (engine, target), walls in timings.items():
+            if engine == engine_name or engine.startswith(engine_name + "["):
+                variants[("WasmKit" + engine[len(engine_name):], target)] = walls
+        return variants
+
+    baseline = variant_timings(engine_names[0])
+    for engine_name in engine_names[1:]:
+        print(f"===== {engine_name} vs {engine_names[0]} =====")
+        regressions = compare_timings(baseline, variant_timings(engine_name), args)
+        if regressions:
+            print(f"{regressions} target(s) regressed by more than"
+                  f" {args.regression_threshold:.1%}")
+
+
+def git_revision():
+    """Return the checked out revision, suffixed with "-dirty" if modified."""
+    try:
+        revision = subprocess.check_output(
+            ["git", "-C", SOURCE_ROOT, "rev-parse", "HEAD"], text=True).strip()
+        status = subprocess.check_output(
+            ["git", "-C", SOURCE_ROOT, "status", "--porcelain", "--untracked-files=no"],
+            text=True)
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return revision + "-dirty" if status.strip() else revision
+
+
+def short_revision(revision):
+    return revision[:12] + ("-dirty" if revision.endswith("-dirty") else "")
+
+
+def host_info():
+    """Describe the properties of this host that affect benchmark results."""
+    import hashlib
+    import platform
+
+    cpu_model = platform.processor() or platform.machine()
+    if os.path.exists("/proc/cpuinfo"):
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    cpu_model = line.split(":", 1)[1].strip()
+                    break
+    elif sys.platform == "darwin":
+        try:
+            cpu_model = subprocess.check_output(
+                ["sysctl", "-n", "machdep.cpu.brand_string"], text=True).strip()
+        except (OSError, subprocess.CalledProcessError):
+            pass
+
+    governor = ""
+    governor_path = "/sys/devices/system/cpu/cpu0/cpufreq/scaling_governor"
+    if os.path.exists(governor_path):
+        with open(governor_path) as f:
+            governor = f.read().strip()
+
+    info = {
+        "hostname": platform.node(),
+        "cpu_model": cpu_model,
+        "kernel": f"{platform.system()} {platform.release()}",
+        "governor": governor,
+    }
+    key = "\0".join([cpu_model, info["kernel"], governor, platform.machine()])
+    info["fingerprint"] = hashlib.sha1(key.encode()).hexdigest()[:12]
+    return info
+
+
+HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    revision TEXT NOT NULL,
+    host TEXT NOT NULL,
+    hostname TEXT,
+    cpu_model TEXT,
+    kernel TEXT,
+    governor TEXT
+);
+CREATE TABLE IF NOT EXISTS runs (
+    session_id INTEGER NOT NULL REFERENCES sessions(id),
+    benchmark TEXT NOT NULL,
+    engine TEXT NOT NULL,
+    target TEXT NOT NULL,
+    cpu INTEGER,
+    run INTEGER,
+    wall REAL,
+    user REAL,
+    system REAL,
+    max_rss INTEGER,
+    minor_faults INTEGER,
+    major_faults INTEGER,
+    voluntary_switches INTEGER,
+    involuntary_switches INTEGER,
+    iteration_seconds REAL
+);
+CREATE INDEX IF NOT EXISTS runs_by_pair ON runs (engine, target, session_id);
+"""
+
+
+def open_history(path):
+    import sqlite3
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    db = sqlite3.connect(path)
+    db.executescript(HISTORY_SCHEMA)
+    # Databases created before runs had a score lack its column
+    columns = [row[1] for row in db.execute("PRAGMA table_info(runs)")]
+    if "iteration_seconds" not in columns:
+        db.execute("ALTER TABLE runs ADD COLUMN iteration_seconds REAL")
+    return db
+
+
+def record_history(args, since=None):
+    """Append results to the history database as one session.
+
+    `since` skips results left in the results directory by earlier runs so
+    that they are not recorded twice.
+    """
+    import time
+
+    results = [
+        result for result in load_results(args.results_dir)
+        if since is None or result["end"] >= since
+    ]
+    if not results:
+        print(f"Warning: no results to record in {args.results_dir}")
+        return
+    host = host_info()
+    revision = git_revision()
+
+    db = open_history(args.history)
+    with db:
+        cursor = db.execute(
+            "INSERT INTO sessions (timestamp, revision, host, hostname, cpu_model, kernel, governor)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (time.time(), revision, host["fingerprint"], host["hostname"],
+             host["cpu_model"], host["kernel"], host["governor"]))
+        session_id = cursor.lastrowid
+        columns = ["session_id", "benchmark", "engine", "target", "cpu"] + RUN_COLUMNS
+        db.executemany(
+            f"INSERT INTO runs ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            [
+                [session_id, result["benchmark"], result["engine"], result["target"], result["cpu"]]
+                + [run.get(column) for column in RUN_COLUMNS]
+                for result in results for run in result["runs"]
+            ])
+    db.close()
+    print(f"Recorded {len(results)} results at {short_revision(revision)} on host {host['fingerprint']}"
+          f" in {args.history}")
+
+
+def query_history(args):
+    """Print the per-target time series and flag significant step changes."""
+    import datetime
+    import fnmatch
+
+    db = open_history(args.history)
+    rows = db.execute(
+        "SELECT s.host, s.cpu_model, s.kernel, s.governor, r.engine, r.target,"
+        " s.id, s.timestamp, s.revision, COALESCE(r.iteration_seconds, r.wall)"
+        " FROM runs r JOIN sessions s ON r.session_id = s.id"
+        " ORDER BY s.host, r.engine, r.target, s.timestamp").fetchall()
+    db.close()
+
+    # (host, engine, target) -> {session id: (timestamp, revision, [wall])}
+    series = {}
+    hosts = {}
+    for host, cpu_model, kernel, governor, engine, target, session_id, timestamp, revision, wall in rows:
+        if args.engine and not any(match_engine(engine, p) for p in args.engine):
+            continue
+        if args.history_target and not any(
+                fnmatch.fnmatchcase(target, p) for p in args.history_target):
+            continue
+        hosts[host] = f"{cpu_model}, {kernel}, governor: {governor or 'unknown'}"
+        sessions = series.setdefault((host, engine, target), {})
+        sessions.setdefault(session_id, (timestamp, revision, []))[2].append(wall)
 
-    with open(os.path.join(results_dir, "data.csv"), "w") as f:
-        f.write(f"engine,target,{original_header}")
-        f.writelines(results)
+    for (host, engine, target), sessions in series.items():
+        print(f"===== {engine} / {target} on {host} ({hosts[host]}) =====")
+        previous = None
+        for timestamp, revision, walls in sessions.values():
+            date = datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M")
+            current = median(walls)
+            mark = ""
+            if previous is not None:
+                change = current / median(previous) - 1
+                # Flag changes that are both large and statistically significant
+                if (abs(change) > args.regression_threshold
+                        and mann_whitney_p(previous, walls) < 1 - args.confidence):
+                    mark = f"  STEP {change:+.1%}"
+            print(f"{date}  {short_revision(revision):<18} {current:>10.6f} s {len(walls):>5} runs{mark}")
+            previous = walls
 
 
 def main():
     import argparse
+    import time
     benchmarks = available_benchmarks()
-    engines = available_engines()
 
     parser = argparse.ArgumentParser(description="Run benchmarks")
     parser.add_argument("--skip-build", action="store_true", help="Skip building the benchmark")
+    parser.add_argument("--force-build", action="store_true",
+                        help="Rebuild artifacts even if they are in the build cache")
     parser.add_argument("--verbose", action="store_true", help="Print commands before running them")
     parser.add_argument("--dry-run", action="store_true", help="Print commands without running them")
-    parser.add_argument("--engine", action="append", help="Engines to run", choices=engines.keys())
+    parser.add_argument("--engine", action="append",
+                        help="Engines to run (glob patterns, e.g. 'WasmKit[*lazy*]')")
+    parser.add_argument("--wasmkit-rev", action="append",
+                        help="Benchmark wasmkit-cli built from this git revision in a worktree"
+                             " (repeatable; the first one is the baseline of the A/B report)")
+    parser.add_argument("--wasmkit-binary", action="append", metavar="NAME=PATH",
+                        help="Benchmark a prebuilt wasmkit-cli as engine WasmKit@NAME (repeatable)")
+    parser.add_argument("--threading-model", action="append", choices=["direct", "token"],
+                        help="WasmKit threading model variant to benchmark (repeatable)")
+    parser.add_argument("--compilation-mode", action="append", choices=["eager", "lazy"],
+                        help="WasmKit compilation mode variant to benchmark (repeatable)")
+    parser.add_argument("--stack-size", action="append", type=int,
+                        help="WasmKit interpreter stack size in bytes to benchmark (repeatable)")
     parser.add_argument("--benchmark", action="append", help="Benchmarks to run", choices=benchmarks.keys())
     parser.add_argument("--step", action="append", help="Steps to run",
-                        choices=["build", "run", "concat"])
+                        choices=["build", "run", "concat", "compare", "record", "history"])
     parser.add_argument("--results-dir", help="Directory to save results",
                         default="./.build/results")
+    parser.add_argument("--warmup", type=int,
+                        help="Number of discarded runs before measuring (default: per benchmark)")
+    parser.add_argument("--min-runs", type=int,
+                        help="Minimum number of measured runs (default: per benchmark)")
+    parser.add_argument("--min-time", type=float,
+                        help="Minimum seconds to spend measuring each pair (default: per benchmark)")
+    parser.add_argument("--max-runs", type=int,
+                        help="Maximum number of measured runs (default: unlimited)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Run each WasmKit target once with --profile and report hot functions"
+                             " instead of measuring")
+    parser.add_argument("--profile-top", type=int, default=20,
+                        help="Number of functions to show per profile (default: 20)")
+    parser.add_argument("--keep-traces", action="store_true",
+                        help="Keep the raw trace files of --profile")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Number of (target, engine) pairs to run concurrently,"
+                             " each pinned to its own CPU (default: 1)")
+    parser.add_argument("--cpus", type=parse_cpu_list,
+                        help="CPUs to pin benchmarks to, e.g. '2-9,12' for isolated cores"
+                             " (default: all CPUs available to this process)")
+    parser.add_argument("--history", default="./.build/bench-history.sqlite",
+                        help="SQLite database the record step appends results to"
+                             " (default: ./.build/bench-history.sqlite)")
+    parser.add_argument("--history-target", action="append",
+                        help="Targets to show in the history step (glob patterns)")
+    parser.add_argument("--baseline-dir",
+                        help="Results directory of a previous run to compare against")
+    parser.add_argument("--regression-threshold", type=float, default=0.05,
+                        help="Slowdown ratio tolerated by the compare step (default: 0.05)")
+    parser.add_argument("--confidence", type=float, default=0.95,
+                        help="Confidence level of the speedup intervals (default: 0.95)")
+    parser.add_argument("--bootstrap-samples", type=int, default=2000,
+                        help="Number of bootstrap resamples per target (default: 2000)")
 
     args = parser.parse_args()
     if args.step is None:
-        args.step = ["build", "run", "concat"]
+        args.step = ["build", "run"] if args.profile else ["build", "run", "concat", "record"]
+        if args.baseline_dir is not None:
+            args.step.append("compare")
+    if "compare" in args.step and args.baseline_dir is None:
+        parser.error("the compare step requires --baseline-dir")
 
-    runner = Runner(args, engines, benchmarks)
+    builds = []
+    if "build" in args.step or "run" in args.step:
+        # Other steps only read results, so revisions are not resolved for them
+        try:
+            builds = wasmkit_builds(args.wasmkit_rev, args.wasmkit_binary)
+        except subprocess.CalledProcessError as e:
+            parser.error(f"unknown revision: {e.cmd[-1].removesuffix('^{commit}')}")
+        except ValueError as e:
+            parser.error(str(e))
+        will_build = not args.skip_build and "build" in args.step
+        for artifact in list(ARTIFACTS.values()) + [b for _, b in builds if isinstance(b, Artifact)]:
+            artifact.will_build = will_build
+        engines = available_engines(
+            args.threading_model, args.compilation_mode, args.stack_size, builds)
+        try:
+            runner = Runner(args, engines, benchmarks)
+        except ValueError as e:
+            parser.error(str(e))
     if not args.skip_build and "build" in args.step:
-        runner.build()
+        runner.build(force=args.force_build)
+    run_started_at = None
     if "run" in args.step:
+        run_started_at = time.time()
         runner.run()
+        if len(builds) > 1 and not args.dry_run and not args.profile:
+            compare_wasmkit_builds(args, [name for name, _ in builds], run_started_at)
     if "concat" in args.step:
         concat_results(args)
+    if "record" in args.step and not args.dry_run and not args.profile:
+        record_history(args, since=run_started_at)
+    if "history" in args.step:
+        query_history(args)
+    if "compare" in args.step:
+        sys.exit(compare_results(args))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,236 @@
+// I/O workloads for the WasiIO benchmark of bench.py.
+//
+// Usage: wasi_io <workload> <directory>
+//
+// Each workload prepares its files in the directory without timing it, then
+// times the I/O it is named after and prints
+// "wasi-io: bytes=<n> ops=<n> seconds=<s>", where ops counts the WASI calls
+// doing the I/O. The files are removed afterwards.
+
+#include <dirent.h>
+#include <errno.h>
+#include <fcntl.h>
+#include <limits.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/stat.h>
+#include <time.h>
+#include <unistd.h>
+
+#define BLOCK_SIZE (64 * 1024)
+#define SEQUENTIAL_FILE_SIZE (256 * 1024 * 1024)
+#define RANDOM_BLOCK_SIZE 4096
+#define RANDOM_FILE_SIZE (64 * 1024 * 1024)
+#define RANDOM_OPS 65536
+#define TREE_DIRS 64
+#define TREE_FILES 64
+#define SMALL_WRITE_SIZE 16
+#define SMALL_WRITES 1000000
+
+struct result {
+    long long bytes;
+    long long ops;
+    double seconds;
+};
+
+static char buffer[BLOCK_SIZE];
+
+static double now(void) {
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec + ts.tv_nsec / 1e9;
+}
+
+static void die(const char *what, const char *path) {
+    fprintf(stderr, "%s %s: %s\n", what, path, strerror(errno));
+    exit(1);
+}
+
+static void join(char *out, const char *dir, const char *name) {
+    snprintf(out, PATH_MAX, "%s/%s", dir, name);
+}
+
+static int open_file(const char *path, int flags) {
+    int fd = open(path, flags, 0644);
+    if (fd < 0) die("open", path);
+    return fd;
+}
+
+static void write_all(int fd, const char *data, size_t size, const char *path) {
+    while (size > 0) {
+        ssize_t written = write(fd, data, size);
+        if (written < 0) die("write", path);
+        data += written;
+        size -= written;
+    }
+}
+
+static void fill_file(const char *path, size_t size) {
+    int fd = open_file(path, O_WRONLY | O_CREAT | O_TRUNC);
+    for (size_t offset = 0; offset < size; offset += BLOCK_SIZE) {
+        write_all(fd, buffer, BLOCK_SIZE, path);
+    }
+    close(fd);
+}
+
+static uint64_t next_random(uint64_t *state) {
+    // xorshift64
+    *state ^= *state << 13;
+    *state ^= *state >> 7;
+    *state ^= *state << 17;
+    return *state;
+}
+
+static struct result sequential_write(const char *dir) {
+    char path[PATH_MAX];
+    join(path, dir, "sequential");
+    struct result result = {SEQUENTIAL_FILE_SIZE, 0, 0};
+    double start = now();
+    int fd = open_file(path, O_WRONLY | O_CREAT | O_TRUNC);
+    for (long long offset = 0; offset < SEQUENTIAL_FILE_SIZE; offset += BLOCK_SIZE) {
+        write_all(fd, buffer, BLOCK_SIZE, path);
+        result.ops++;
+    }
+    close(fd);
+    result.seconds = now() - start;
+    unlink(path);
+    return result;
+}
+
+static struct result sequential_read(const char *dir) {
+    char path[PATH_MAX];
+    join(path, dir, "sequential");
+    fill_file(path, SEQUENTIAL_FILE_SIZE);
+    struct result result = {0, 0, 0};
+    double start = now();
+    int fd = open_file(path, O_RDONLY);
+    ssize_t count;
+    while ((count = read(fd, buffer, BLOCK_SIZE)) > 0) {
+        result.bytes += count;
+        result.ops++;
+    }
+    if (count < 0) die("read", path);
+    close(fd);
+    result.seconds = now() - start;
+    unlink(path);
+    return result;
+}
+
+static struct result random_access(const char *dir, int writing) {
+    char path[PATH_MAX];
+    join(path, dir, "random");
+    fill_file(path, RANDOM_FILE_SIZE);
+    uint64_t state = 0x9e3779b97f4a7c15;
+    struct result result = {(long long)RANDOM_OPS * RANDOM_BLOCK_SIZE, RANDOM_OPS, 0};
+    int fd = open_file(path, writing ? O_WRONLY : O_RDONLY);
+    double start = now();
+    for (int i = 0; i < RANDOM_OPS; i++) {
+        off_t offset = (off_t)(next_random(&state) % (RANDOM_FILE_SIZE / RANDOM_BLOCK_SIZE)) * RANDOM_BLOCK_SIZE;
+        ssize_t count = writing
+            ? pwrite(fd, buffer, RANDOM_BLOCK_SIZE, offset)
+            : pread(fd, buffer, RANDOM_BLOCK_SIZE, offset);
+        if (count != RANDOM_BLOCK_SIZE) die(writing ? "pwrite" : "pread", path);
+    }
+    result.seconds = now() - start;
+    close(fd);
+    unlink(path);
+    return result;
+}
+
+static long long walk(const char *dir) {
+    DIR *handle = opendir(dir);
+    if (handle == NULL) die("opendir", dir);
+    long long ops = 1;
+    struct dirent *entry;
+    while ((entry = readdir(handle)) != NULL) {
+        if (strcmp(entry->d_name, ".") == 0 || strcmp(entry->d_name, "..") == 0) continue;
+        char path[PATH_MAX];
+        join(path, dir, entry->d_name);
+        struct stat st;
+        if (stat(path, &st) != 0) die("stat", path);
+        ops++;
+        if (S_ISDIR(st.st_mode)) ops += walk(path);
+    }
+    closedir(handle);
+    return ops;
+}
+
+static struct result directory_walk(const char *dir) {
+    char root[PATH_MAX], subdir[PATH_MAX], path[PATH_MAX], name[32];
+    join(root, dir, "tree");
+    if (mkdir(root, 0755) != 0) die("mkdir", root);
+    for (int d = 0; d < TREE_DIRS; d++) {
+        snprintf(name, sizeof(name), "d%02d", d);
+        join(subdir, root, name);
+        if (mkdir(subdir, 0755) != 0) die("mkdir", subdir);
+        for (int f = 0; f < TREE_FILES; f++) {
+            snprintf(name, sizeof(name), "f%02d", f);
+            join(path, subdir, name);
+            close(open_file(path, O_WRONLY | O_CREAT | O_TRUNC));
+        }
+    }
+
+    struct result result = {0, 0, 0};
+    double start = now();
+    result.ops = walk(root);
+    result.seconds = now() - start;
+
+    for (int d = 0; d < TREE_DIRS; d++) {
+        snprintf(name, sizeof(name), "d%02d", d);
+        join(subdir, root, name);
+        for (int f = 0; f < TREE_FILES; f++) {
+            snprintf(name, sizeof(name), "f%02d", f);
+            join(path, subdir, name);
+            unlink(path);
+        }
+        rmdir(subdir);
+    }
+    rmdir(root);
+    return result;
+}
+
+static struct result small_writes(const char *dir) {
+    char path[PATH_MAX];
+    join(path, dir, "small");
+    struct result result = {(long long)SMALL_WRITES * SMALL_WRITE_SIZE, SMALL_WRITES, 0};
+    int fd = open_file(path, O_WRONLY | O_CREAT | O_TRUNC);
+    double start = now();
+    for (int i = 0; i < SMALL_WRITES; i++) {
+        write_all(fd, buffer, SMALL_WRITE_SIZE, path);
+    }
+    result.seconds = now() - start;
+    close(fd);
+    unlink(path);
+    return result;
+}
+
+int main(int argc, char **argv) {
+    if (argc != 3) {
+        fprintf(stderr, "usage: %s <workload> <directory>\n", argv[0]);
+        return 1;
+    }
+    const char *workload = argv[1], *dir = argv[2];
+    memset(buffer, 'x', sizeof(buffer));
+
+    struct result result;
+    if (strcmp(workload, "seq-write") == 0) {
+        result = sequential_write(dir);
+    } else if (strcmp(workload, "seq-read") == 0) {
+        result = sequential_read(dir);
+    } else if (strcmp(workload, "rand-read") == 0) {
+        result = random_access(dir, 0);
+    } else if (strcmp(workload, "rand-write") == 0) {
+        result = random_access(dir, 1);
+    } else if (strcmp(workload, "dir-walk") == 0) {
+        result = directory_walk(dir);
+    } else if (strcmp(workload, "small-writes") == 0) {
+        result = small_writes(dir);
+    } else {
+        fprintf(stderr, "unknown workload: %s\n", workload);
+        return 1;
+    }
+    printf("wasi-io: bytes=%lld ops=%lld seconds=%.9f\n", result.bytes, result.ops, result.seconds);
+    return 0;
+}
@@ -19,6 +19,9 @@ struct ExecResult {
     let values: [Value]?
     let trap: String?
     let memory: [UInt8]?
+    /// Seconds spent in the call of the exported function alone, without
+    /// compiling or instantiating the module
+    var executionTime: Double = 0
 
     var hasTrap: Bool {
         return trap != nil
@@ -57,6 +60,11 @@ struct ExecResult {
     }
 }
 
+/// Seconds elapsed since `start`, an uptime in nanoseconds from `DispatchTime`
+func secondsSince(_ start: UInt64) -> Double {
+    return Double(DispatchTime.now().uptimeNanoseconds - start) / 1_000_000_000
+}
+
 struct ExecError: Error, CustomStringConvertible {
     let description: String
     init(_ description: String) {
@@ -139,11 +147,14 @@ struct WasmKitEngine: Engine {
         }
         let type = fn.type
         let arguments = type.parameters.map { $0.defaultValue }
+        let start = DispatchTime.now().uptimeNanoseconds
         do {
             let results = try fn(arguments)
-            return ExecResult(values: results, trap: nil, memory: memory?.data)
+            let executionTime = secondsSince(start)
+            return ExecResult(values: results, trap: nil, memory: memory?.data, executionTime: executionTime)
         } catch {
-            return ExecResult(values: nil, trap: String(describing: error), memory: memory?.data)
+            let executionTime = secondsSince(start)
+            return ExecResult(values: nil, trap: String(describing: error), memory: memory?.data, executionTime: executionTime)
         }
     }
 }
@@ -158,7 +169,9 @@ struct ReferenceEngine: Engine {
 
     func run(module: UnsafeRawBufferPointer) throws -> ExecResult {
         let engine = WasmCAPI.wasm_engine_new()
+        defer { WasmCAPI.wasm_engine_delete(engine) }
         let store = WasmCAPI.wasm_store_new(engine)
+        defer { WasmCAPI.wasm_store_delete(store) }
         var bytes = WasmCAPI.wasm_byte_vec_t()
         wasm_byte_vec_new(&bytes, module.count, module.baseAddress)
         defer { wasm_byte_vec_delete(&bytes) }
@@ -235,8 +248,11 @@ struct ReferenceEngine: Engine {
         }
         var results = WasmCAPI.wasm_val_vec_t()
         WasmCAPI.wasm_val_vec_new_uninitialized(&results, Int(resultTypes?.pointee.size ?? 0))
+        defer { WasmCAPI.wasm_val_vec_delete(&results) }
 
+        let start = DispatchTime.now().uptimeNanoseconds
         let trap = WasmCAPI.wasm_func_call(fn, &arguments, &results)
+        let executionTime = secondsSince(start)
         let memoryData = memory.flatMap { memory in
             let size = WasmCAPI.wasm_memory_data_size(memory)
             let data = WasmCAPI.wasm_memory_data(memory)
@@ -245,9 +261,11 @@ struct ReferenceEngine: Engine {
             }
         }
         if let trap = trap {
+            defer { WasmCAPI.wasm_trap_delete(trap) }
             var message = WasmCAPI.wasm_message_t()
             WasmCAPI.wasm_trap_message(trap, &message)
-            return ExecResult(values: nil, trap: message.string, memory: memoryData)
+            defer { WasmCAPI.wasm_byte_vec_delete(&message) }
+            return ExecResult(values: nil, trap: message.string, memory: memoryData, executionTime: executionTime)
         }
 
         let numberOfResults = Int(resultTypes?.pointee.size ?? 0)
@@ -263,14 +281,17 @@ struct ReferenceEngine: Engine {
                 throw ExecError("Unsupported value type: \(kind)")
             }
         }
-        return ExecResult(values: values, trap: nil, memory: memoryData)
+        return ExecResult(values: values, trap: nil, memory: memoryData, executionTime: executionTime)
     }
 }
 
 @main struct Main {
     static func main() {
+        if CommandLine.arguments[1] == "--batch" {
+            runBatch()
+        }
         let shrinking = ProcessInfo.processInfo.environment["SHRINKING"] == "1"
-        let ok = _main()
+        let ok = check(moduleFile: CommandLine.arguments[1])
         if shrinking {
             // While shrinking, failure is "interesting" and reducer expects non-zero exit code
             // for interesting cases.
@@ -278,9 +299,27 @@ struct ReferenceEngine: Engine {
         }
         exit(ok ? 0 : 1)
     }
-    static func _main() -> Bool {
+
+    /// Checks modules whose paths are read from stdin line by line, so that one process
+    /// can check many modules without paying the startup cost each time.
+    ///
+    /// Each verdict is reported as a `#result ok` or `#result diff` line on stdout after
+    /// the diagnostics and the `#time <engine> <seconds>` lines of the module, which time
+    /// the call of the exported function only. A crash is
+    /// attributed to the module being checked by the driver, which sees the process exit
+    /// before the verdict.
+    static func runBatch() -> Never {
+        while let moduleFile = readLine() {
+            let ok = check(moduleFile: moduleFile)
+            print("#result \(ok ? "ok" : "diff")")
+            fflush(stdout)
+        }
+        exit(0)
+    }
+
+    static func check(moduleFile: String) -> Bool {
         do {
-            return try run(moduleFile: CommandLine.arguments[1])
+            return try run(moduleFile: moduleFile)
         } catch {
             // Ignore errors
             return true
@@ -298,7 +337,12 @@ struct ReferenceEngine: Engine {
         } else {
             moduleBytes = try Array(Data(contentsOf: URL(fileURLWithPath: moduleFile)))
         }
-        let results = try engines.map { try ($0.run(moduleBytes: moduleBytes), $0.name) }
+        let results = try engines.map { engine in
+            let result = try engine.run(moduleBytes: moduleBytes)
+            // Lets the driver compare the engines' execution times
+            print("#time \(engine.name) \(result.executionTime)")
+            return (result, engine.name)
+        }
         guard results.count > 1 else {
             throw ExecError("Expected at least two engines")
         }
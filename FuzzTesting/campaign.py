@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""Runs a fuzzing campaign across several hosts.
+
+The coordinator owns the campaign state: the shared corpus, the failure
+buckets, and the throughput of every worker. Each worker runs one of the
+fuzzing drivers locally and periodically syncs with the coordinator over
+TCP, uploading new corpus entries and failures and downloading the corpus
+entries found by others.
+
+    ./campaign.py coordinator FuzzExecute --listen 0.0.0.0:7000
+    ./campaign.py worker build-host-1:7000 -j 32
+"""
+import os
+import re
+import sys
+import json
+import time
+import base64
+import socket
+import asyncio
+import hashlib
+
+from triage import BucketIndex, LIBFUZZER_ARTIFACT_PATTERN
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+
+# Messages are single JSON lines carrying testcases in base64
+MESSAGE_LIMIT = 256 * 1024 * 1024
+# Number of corpus entries exchanged per sync in each direction
+SYNC_BATCH = 1024
+
+# Progress lines of differential.py ("#100 (iter/s: 21.42)") and
+# libFuzzer ("#1234 NEW cov: 12 ... exec/s: 56 ...")
+STATS_PATTERN = re.compile(r"^#(\d+)\D.*?(?:iter/s|exec/s):?\s*([\d.]+)")
+
+
+async def send(writer, message):
+    writer.write(json.dumps(message).encode() + b"\n")
+    await writer.drain()
+
+
+async def receive(reader):
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Connection closed")
+    return json.loads(line)
+
+
+def encode(data):
+    return base64.b64encode(data).decode()
+
+
+def decode(data):
+    return base64.b64decode(data)
+
+
+def parse_address(address):
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+class Coordinator:
+    def __init__(self, target, campaign_dir, sync_interval):
+        self.target = target
+        self.sync_interval = sync_interval
+        self.corpus_dir = os.path.join(campaign_dir, "corpus", target)
+        self.fail_dir = os.path.join(campaign_dir, "FailCases", target)
+        os.makedirs(self.corpus_dir, exist_ok=True)
+        os.makedirs(self.fail_dir, exist_ok=True)
+        self.buckets = BucketIndex(self.fail_dir)
+        # Workers download the corpus by their position in this list
+        self.corpus = sorted(os.listdir(self.corpus_dir))
+        self.known_corpus = set(self.corpus)
+        self.workers = {}
+        self.started = time.monotonic()
+
+    async def handle(self, reader, writer):
+        name = None
+        try:
+            while True:
+                message = await receive(reader)
+                if message["type"] == "hello":
+                    name = message["name"]
+                    self.workers[name] = {
+                        "host": message["host"], "jobs": message["jobs"],
+                        "iterations": 0, "rate": 0.0, "connected": True,
+                        "last_seen": time.monotonic(),
+                    }
+                    print(f"Worker {name} joined with {message['jobs']} jobs")
+                    await send(writer, {
+                        "target": self.target,
+                        "sync_interval": self.sync_interval,
+                    })
+                elif message["type"] == "sync":
+                    await send(writer, self.sync(name, message))
+        except (ConnectionError, json.JSONDecodeError):
+            pass
+        finally:
+            if name in self.workers:
+                self.workers[name]["connected"] = False
+                print(f"Worker {name} left")
+            writer.close()
+
+    def sync(self, name, message):
+        worker = self.workers[name]
+        worker.update(message["stats"])
+        worker["last_seen"] = time.monotonic()
+
+        for entry in message["corpus"]:
+            data = decode(entry["data"])
+            corpus_name = hashlib.sha1(data).hexdigest()
+            if corpus_name in self.known_corpus:
+                continue
+            with open(os.path.join(self.corpus_dir, corpus_name), "wb") as f:
+                f.write(data)
+            self.corpus.append(corpus_name)
+            self.known_corpus.add(corpus_name)
+
+        for entry in message["buckets"]:
+            if "data" in entry:
+                path = os.path.join(self.fail_dir, os.path.basename(entry["name"]))
+                with open(path, "wb") as f:
+                    f.write(decode(entry["data"]))
+                self.buckets.add(path, entry["signature"], entry["output"],
+                                 hits=entry["hits"])
+            elif entry["key"] in self.buckets.buckets:
+                self.buckets.buckets[entry["key"]]["hits"] += entry["hits"]
+                self.buckets.save()
+
+        # Crashes libFuzzer found that have not been triaged yet
+        for entry in message["artifacts"]:
+            path = os.path.join(self.fail_dir, os.path.basename(entry["name"]))
+            if not os.path.exists(path):
+                with open(path, "wb") as f:
+                    f.write(decode(entry["data"]))
+
+        cursor = message["corpus_cursor"]
+        corpus = []
+        for corpus_name in self.corpus[cursor:cursor + SYNC_BATCH]:
+            with open(os.path.join(self.corpus_dir, corpus_name), "rb") as f:
+                corpus.append({"name": corpus_name, "data": encode(f.read())})
+        return {
+            "corpus": corpus,
+            "corpus_cursor": cursor + len(corpus),
+            "buckets": {
+                key: bucket["size"]
+                for key, bucket in self.buckets.buckets.items()
+            },
+        }
+
+    def untriaged(self):
+        return sum(
+            1 for name in os.listdir(self.fail_dir)
+            if LIBFUZZER_ARTIFACT_PATTERN.match(name)
+            and name not in self.buckets.reproducers()
+        )
+
+    def summary(self):
+        connected = [w for w in self.workers.values() if w["connected"]]
+        iterations = sum(w["iterations"] for w in self.workers.values())
+        rate = sum(w["rate"] for w in connected)
+        lines = [
+            f"===== Campaign {self.target}:"
+            f" {len(connected)}/{len(self.workers)} workers,"
+            f" {iterations} iterations ({rate:.1f}/s),"
+            f" corpus {len(self.corpus)},"
+            f" {len(self.buckets.buckets)} buckets,"
+            f" {self.untriaged()} untriaged crashes ====="
+        ]
+        now = time.monotonic()
+        for name, worker in sorted(self.workers.items()):
+            state = (f"synced {now - worker['last_seen']:.0f}s ago"
+                     if worker["connected"] else "disconnected")
+            lines.append(
+                f"  {name:24} {worker['jobs']:4} jobs"
+                f" {worker['iterations']:12} iterations"
+                f" {worker['rate']:10.1f}/s  {state}")
+        return "\n".join(lines)
+
+    async def report(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            print(self.summary())
+
+
+class Worker:
+    def __init__(self, args):
+        self.args = args
+        self.name = args.name or f"{socket.gethostname()}-{os.getpid()}"
+        self.work_dir = os.path.abspath(
+            args.work_dir or os.path.join(dir_path, ".build", "campaign", self.name))
+        self.corpus_dir = None
+        self.fail_dir = None
+        self.corpus_cursor = 0
+        self.known_corpus = set()
+        self.sent_hits = {}
+        self.sent_artifacts = set()
+        self.remote_buckets = {}
+        self.stats = {"iterations": 0, "rate": 0.0}
+
+    def driver_command(self, target):
+        if target == "differential":
+            self.fail_dir = os.path.join(self.work_dir, "FailCases", "FuzzDifferential")
+            return [
+                sys.executable, os.path.join(dir_path, "differential.py"),
+                "--progress", "stdout", "-j", str(self.args.jobs),
+                "--work-dir", os.path.join(self.work_dir, "tmp"),
+                "--fail-dir", self.fail_dir,
+            ] + self.args.driver_args
+        self.corpus_dir = os.path.join(self.work_dir, "corpus")
+        self.fail_dir = os.path.join(self.work_dir, "FailCases", target)
+        command = [
+            sys.executable, os.path.join(dir_path, "fuzz.py"), "run",
+            "-j", str(self.args.jobs),
+            "--corpus-dir", self.corpus_dir, "--artifact-dir", self.fail_dir,
+        ]
+        if self.args.skip_build:
+            command.append("--skip-build")
+        # Everything after the target is passed to the fuzzer
+        return command + [target] + self.args.driver_args
+
+    def collect(self):
+        """Gather what the coordinator has not seen from this worker yet."""
+        corpus = []
+        if self.corpus_dir is not None and os.path.isdir(self.corpus_dir):
+            for name in sorted(os.listdir(self.corpus_dir)):
+                if len(corpus) >= SYNC_BATCH:
+                    break
+                if name in self.known_corpus:
+                    continue
+                self.known_corpus.add(name)
+                with open(os.path.join(self.corpus_dir, name), "rb") as f:
+                    corpus.append({"name": name, "data": encode(f.read())})
+
+        buckets = []
+        artifacts = []
+        if self.fail_dir is not None and os.path.isdir(self.fail_dir):
+            index = BucketIndex(self.fail_dir)
+            for key, bucket in index.buckets.items():
+                entry = {
+                    "key": key,
+                    "signature": bucket["signature"],
+                    "output": bucket["output"],
+                    "hits": bucket["hits"] - self.sent_hits.get(key, 0),
+                }
+                remote_size = self.remote_buckets.get(key)
+                if remote_size is None or bucket["size"] < remote_size:
+                    entry["name"] = bucket["reproducer"]
+                    with open(os.path.join(self.fail_dir, bucket["reproducer"]), "rb") as f:
+                        entry["data"] = encode(f.read())
+                elif entry["hits"] == 0:
+                    continue
+                self.sent_hits[key] = bucket["hits"]
+                buckets.append(entry)
+            reproducers = index.reproducers()
+            for name in sorted(os.listdir(self.fail_dir)):
+                if name in self.sent_artifacts or name in reproducers \
+                        or not LIBFUZZER_ARTIFACT_PATTERN.match(name):
+                    continue
+                self.sent_artifacts.add(name)
+                with open(os.path.join(self.fail_dir, name), "rb") as f:
+                    artifacts.append({"name": name, "data": encode(f.read())})
+        return corpus, buckets, artifacts
+
+    async def sync(self, reader, writer):
+        corpus, buckets, artifacts = self.collect()
+        await send(writer, {
+            "type": "sync",
+            "stats": self.stats,
+            "corpus_cursor": self.corpus_cursor,
+            "corpus": corpus,
+            "buckets": buckets,
+            "artifacts": artifacts,
+        })
+        reply = await receive(reader)
+        self.corpus_cursor = reply["corpus_cursor"]
+        self.remote_buckets = reply["buckets"]
+        for entry in reply["corpus"]:
+            self.known_corpus.add(entry["name"])
+            if self.corpus_dir is None:
+                continue
+            path = os.path.join(self.corpus_dir, os.path.basename(entry["name"]))
+            if not os.path.exists(path):
+                with open(path, "wb") as f:
+                    f.write(decode(entry["data"]))
+        return reply
+
+    async def forward_output(self, stream):
+        while True:
+            line = await stream.readline()
+            if not line:
+                return
+            sys.stdout.buffer.write(line)
+            sys.stdout.flush()
+            match = STATS_PATTERN.match(line.decode(errors="replace"))
+            if match:
+                self.stats = {
+                    "iterations": int(match.group(1)),
+                    "rate": float(match.group(2)),
+                }
+
+    async def run(self):
+        host, port = parse_address(self.args.coordinator)
+        reader, writer = await asyncio.open_connection(
+            host, port, limit=MESSAGE_LIMIT)
+        await send(writer, {
+            "type": "hello", "name": self.name,
+            "host": socket.gethostname(), "jobs": self.args.jobs,
+        })
+        config = await receive(reader)
+        command = self.driver_command(config["target"])
+        for directory in (self.corpus_dir, self.fail_dir):
+            if directory is not None:
+                os.makedirs(directory, exist_ok=True)
+
+        # Start from the whole shared corpus
+        while (await self.sync(reader, writer))["corpus"]:
+            pass
+
+        print(f"===== Worker {self.name} running {config['target']} =====")
+        print("+ " + " ".join(command))
+        proc = await asyncio.create_subprocess_exec(
+            *command, cwd=dir_path,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+        output = asyncio.create_task(self.forward_output(proc.stdout))
+        try:
+            while proc.returncode is None:
+                try:
+                    await asyncio.wait_for(
+                        proc.wait(), timeout=config["sync_interval"])
+                except TimeoutError:
+                    pass
+                await self.sync(reader, writer)
+        finally:
+            if proc.returncode is None:
+                proc.terminate()
+                await proc.wait()
+            await output
+            # Report what was found since the last sync
+            try:
+                await self.sync(reader, writer)
+            except (ConnectionError, OSError):
+                pass
+            writer.close()
+        return proc.returncode
+
+
+async def coordinate(args):
+    coordinator = Coordinator(args.target, args.campaign_dir, args.sync_interval)
+    host, port = parse_address(args.listen)
+    server = await asyncio.start_server(
+        coordinator.handle, host, port, limit=MESSAGE_LIMIT)
+    print(f"===== Coordinating {args.target} on {host}:{port} =====")
+    report = asyncio.create_task(coordinator.report())
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        report.cancel()
+        print(coordinator.summary())
+        print(coordinator.buckets.summary())
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Run a fuzzing campaign across several hosts")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    coordinator_parser = subparsers.add_parser(
+        "coordinator", help="Serve the campaign state to workers")
+    coordinator_parser.add_argument(
+        "target",
+        help="'differential' or the name of a libFuzzer target to fuzz")
+    coordinator_parser.add_argument(
+        "--listen", default="127.0.0.1:7000",
+        help="Address to accept workers on")
+    coordinator_parser.add_argument(
+        "--campaign-dir", default=os.path.join(dir_path, ".build", "campaign"),
+        help="Directory to keep the shared corpus and failures in")
+    coordinator_parser.add_argument(
+        "--sync-interval", type=float, default=30,
+        help="Seconds between syncs of each worker")
+
+    worker_parser = subparsers.add_parser(
+        "worker", help="Fuzz on this host as part of a campaign; arguments"
+        " after '--' are passed to the fuzzing driver")
+    worker_parser.add_argument(
+        "coordinator", help="Address of the coordinator, e.g. host:7000")
+    worker_parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count(),
+        help="Number of lanes or fuzzing processes to run on this host")
+    worker_parser.add_argument(
+        "--name", help="Name of the worker (default: <hostname>-<pid>)")
+    worker_parser.add_argument(
+        "--work-dir",
+        help="Directory for the local corpus and failures"
+             " (default: .build/campaign/<name>)")
+    worker_parser.add_argument(
+        "--skip-build", action="store_true",
+        help="Skip building the libFuzzer target")
+
+    # Arguments after '--' are passed to the fuzzing driver as is
+    argv = sys.argv[1:]
+    driver_args = []
+    if "--" in argv:
+        argv, driver_args = argv[:argv.index("--")], argv[argv.index("--") + 1:]
+    args = parser.parse_args(argv)
+    args.driver_args = driver_args
+    try:
+        if args.command == "coordinator":
+            asyncio.run(coordinate(args))
+        else:
+            sys.exit(asyncio.run(Worker(args).run()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,28 @@
 #!/usr/bin/env python3
 import os
 import time
-import subprocess
 import shutil
 import asyncio
+from triage import BucketIndex, bucket_signature
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
 fail_dir = os.path.join(dir_path, "FailCases", "FuzzDifferential")
 tmp_dir = os.path.join(dir_path, ".build", "FuzzDifferential")
 
 
-def dump_crash_wasm(file, prefix):
+def dump_crash_wasm(file, prefix, directory=None):
     import hashlib
     with open(file, "rb") as f:
         content = f.read()
         hash_value = hashlib.sha1(content).hexdigest()
-    crash_file = os.path.join(fail_dir, f"{prefix}-{hash_value}.wasm")
+    crash_file = os.path.join(
+        directory or fail_dir, f"{prefix}-{hash_value}.wasm")
     shutil.copy(file, crash_file)
     return crash_file
 
 
-async def shrink_testcase(wasm_file, program, output):
+async def shrink_testcase(wasm_file, program, output, timeout):
+    """Shrink the testcase into `output` and return whether it succeeded."""
     # The fuzzer executable behaves as a predicate script
     # when SHRINKING env variable is set to 1
     cmd = ["wasm-tools", "shrink", program, wasm_file, "-o", output]
@@ -31,12 +33,157 @@ async def shrink_testcase(wasm_file, program, output):
         *cmd, env=env,
         stdout=asyncio.subprocess.DEVNULL,
         stderr=asyncio.subprocess.DEVNULL)
-    await proc.wait()
+    try:
+        await asyncio.wait_for(proc.wait(), timeout=timeout)
+    except TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return False
+    return proc.returncode == 0 and os.path.exists(output)
+
+
+class ShrinkPool:
+    """Shrinks found testcases in the background so that lanes keep fuzzing.
+
+    A shrunk testcase replaces the reproducer of its bucket in `buckets`.
+    When the queue is full, new testcases are kept unshrunk instead of
+    blocking.
+    """
+
+    def __init__(self, program, buckets, jobs, queue_size, timeout):
+        self.program = program
+        self.buckets = buckets
+        self.jobs = jobs
+        self.timeout = timeout
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.tasks = []
+        self.shrunk = 0
+        self.dropped = 0
+
+    def start(self):
+        self.tasks = [
+            asyncio.create_task(self.work()) for _ in range(self.jobs)
+        ]
+
+    def submit(self, crash_file):
+        if self.jobs == 0:
+            return
+        try:
+            self.queue.put_nowait(crash_file)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def work(self):
+        while True:
+            crash_file = await self.queue.get()
+            try:
+                output = crash_file[:-len(".wasm")] + ".shrunk.wasm"
+                if await shrink_testcase(
+                        crash_file, self.program, output, self.timeout) \
+                        and self.buckets.replace_reproducer(crash_file, output):
+                    self.shrunk += 1
+            finally:
+                self.queue.task_done()
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+class BatchWorker:
+    """A long-lived `FuzzDifferential --batch` process checking modules one by one.
+
+    The process is respawned after it crashes or times out, and after
+    `max_modules` modules to bound the memory it accumulates. Its stderr
+    goes to `stderr_path` so that crash reports can be attributed to the
+    module being checked.
+    """
+
+    def __init__(self, program, max_modules, stderr_path):
+        self.program = program
+        self.max_modules = max_modules
+        self.stderr_path = stderr_path
+        self.proc = None
+        self.checked = 0
+
+    async def ensure_started(self):
+        if self.proc is not None and self.proc.returncode is None \
+                and self.checked < self.max_modules:
+            return
+        await self.stop()
+        with open(self.stderr_path, "wb") as stderr:
+            self.proc = await asyncio.create_subprocess_exec(
+                self.program, "--batch",
+                stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+                stderr=stderr)
+        self.checked = 0
+
+    def read_stderr(self, offset):
+        with open(self.stderr_path, "rb") as f:
+            f.seek(offset)
+            return f.read().decode(errors="replace").splitlines()
+
+    async def check(self, wasm_file, timeout):
+        """Check the module and return its verdict and diagnostic output.
 
+        The verdict is "ok", "diff", or "crash" when the worker exited before
+        reporting one. Raises TimeoutError after killing a stuck worker.
+        """
+        await self.ensure_started()
+        self.checked += 1
+        stderr_offset = os.path.getsize(self.stderr_path)
+        try:
+            self.proc.stdin.write(wasm_file.encode() + b"\n")
+            await self.proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # The worker exited after its previous verdict; start over
+            await self.stop()
+            await self.ensure_started()
+            stderr_offset = 0
+            self.proc.stdin.write(wasm_file.encode() + b"\n")
+            await self.proc.stdin.drain()
+
+        output = []
+
+        async def read_verdict():
+            while True:
+                line = await self.proc.stdout.readline()
+                if not line:
+                    await self.proc.wait()
+                    return "crash"
+                line = line.decode(errors="replace").rstrip("\n")
+                if line.startswith("#result "):
+                    return line[len("#result "):]
+                output.append(line)
+
+        try:
+            verdict = await asyncio.wait_for(read_verdict(), timeout=timeout)
+        except TimeoutError:
+            await self.stop()
+            raise
+        return verdict, output + self.read_stderr(stderr_offset)
+
+    async def stop(self):
+        if self.proc is not None and self.proc.returncode is None:
+            self.proc.kill()
+            await self.proc.wait()
+        self.proc = None
 
-async def run_single(lane, i, program):
-    # Generate a WebAssembly file using wasm-smith
-    wasm_file = os.path.join(tmp_dir, f"t{lane}.wasm")
+
+def record_failure(wasm_file, kind, output, buckets, shrink_pool):
+    """Bucket the failure and return the saved testcase if it was kept."""
+    # Save the testcase right away as the lane reuses its file
+    crash_file = dump_crash_wasm(wasm_file, kind)
+    if not buckets.add(crash_file, bucket_signature(kind, output), output):
+        return None
+    if kind != "timeout":
+        shrink_pool.submit(crash_file)
+    return crash_file
+
+
+async def generate_module(wasm_file, random_seed):
+    """Generate a WebAssembly file using wasm-smith; returns whether it succeeded."""
     cmd = [
         "wasm-tools", "smith",
         "-o", wasm_file,
@@ -53,30 +200,507 @@ async def run_single(lane, i, program):
         "--max-memory32-bytes=65536",
         "--memory-max-size-required=true"
     ]
-    random_seed = os.urandom(100)
 
     proc = await asyncio.create_subprocess_exec(
         *cmd, stdin=asyncio.subprocess.PIPE)
     proc.stdin.write(random_seed)
     proc.stdin.close()
     await proc.wait()
+    return proc.returncode == 0
+
+
+class ModulePipeline:
+    """Generates modules ahead of the lanes executing them.
+
+    A pool of generator tasks fills a bounded queue, so that lanes do not
+    idle during generation and both stages can be scaled separately. Time
+    spent in and waiting on each stage is tracked to help balance them.
+    Modules are numbered by the campaign, which derives their seeds.
+    """
+
+    def __init__(self, generators, depth, module_dir, campaign):
+        self.generators = generators
+        self.module_dir = module_dir
+        self.campaign = campaign
+        self.queue = asyncio.Queue(maxsize=depth)
+        self.tasks = []
+        self.started = time.monotonic()
+        self.generated = 0
+        self.failed = 0
+        self.generate_time = 0.0
+        # Time generators wait for room in the queue
+        self.blocked_time = 0.0
+        self.execute_time = 0.0
+        # Time lanes wait for a module
+        self.starved_time = 0.0
+        self.depth_total = 0
+        self.depth_samples = 0
+
+    def start(self):
+        os.makedirs(self.module_dir, exist_ok=True)
+        self.started = time.monotonic()
+        self.tasks = [
+            asyncio.create_task(self.generate())
+            for _ in range(self.generators)
+        ]
+
+    async def generate(self):
+        while True:
+            module = self.campaign.next_module
+            self.campaign.next_module += 1
+            wasm_file = os.path.join(self.module_dir, f"m{module}.wasm")
+            start = time.monotonic()
+            try:
+                ok = await generate_module(
+                    wasm_file, self.campaign.module_seed(module))
+                generated = time.monotonic()
+                self.generate_time += generated - start
+                if not ok:
+                    self.failed += 1
+                    continue
+                await self.queue.put((wasm_file, module))
+            except asyncio.CancelledError:
+                if os.path.exists(wasm_file):
+                    os.remove(wasm_file)
+                raise
+            self.blocked_time += time.monotonic() - generated
+            self.generated += 1
+
+    async def take(self):
+        """Return the next module file and its number."""
+        self.depth_total += self.queue.qsize()
+        self.depth_samples += 1
+        start = time.monotonic()
+        item = await self.queue.get()
+        self.starved_time += time.monotonic() - start
+        return item
+
+    def summary(self, lanes):
+        elapsed = time.monotonic() - self.started
+
+        def share(seconds, workers):
+            return 100 * seconds / (elapsed * workers) if elapsed and workers else 0
+
+        average_depth = self.depth_total / max(self.depth_samples, 1)
+        return (
+            f"Queue {self.queue.qsize()}/{self.queue.maxsize}"
+            f" (avg {average_depth:.1f});"
+            f" {self.generators} generators"
+            f" {share(self.generate_time, self.generators):.0f}% busy,"
+            f" {share(self.blocked_time, self.generators):.0f}% blocked;"
+            f" {lanes} lanes"
+            f" {share(self.execute_time, lanes):.0f}% busy,"
+            f" {share(self.starved_time, lanes):.0f}% starved"
+        )
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        while not self.queue.empty():
+            wasm_file, _ = self.queue.get_nowait()
+            os.remove(wasm_file)
+
+
+# Engine names in the `#time` lines, as reported by FuzzDifferential
+WASMKIT_ENGINE = "wasmkit"
+REFERENCE_ENGINE = "reference"
+
+
+def split_timings(lines):
+    """Separate the `#time <engine> <seconds>` lines from the diagnostics."""
+    output = []
+    timings = {}
+    for line in lines:
+        if line.startswith("#time "):
+            _, engine, seconds = line.split(" ", 2)
+            timings[engine] = float(seconds)
+        else:
+            output.append(line)
+    return output, timings
+
+
+# Instruction categories of the mix recorded for each module in perf mode
+INSTRUCTION_CATEGORIES = [
+    "control", "call", "variable", "memory", "i32", "i64", "f32", "f64",
+    "v128", "other",
+]
+CONTROL_INSTRUCTIONS = {
+    "block", "loop", "if", "else", "end", "br", "br_if", "br_table",
+    "return", "unreachable", "nop", "select", "drop",
+}
+
+
+def instruction_category(opcode):
+    if opcode in CONTROL_INSTRUCTIONS:
+        return "control"
+    if opcode.startswith(("call", "return_call")):
+        return "call"
+    if opcode.startswith(("local.", "global.")):
+        return "variable"
+    if ".load" in opcode or ".store" in opcode or opcode.startswith(
+            ("memory.", "data.")):
+        return "memory"
+    prefix = opcode.split(".")[0]
+    if prefix in INSTRUCTION_CATEGORIES:
+        return prefix
+    return "other"
+
+
+async def module_profile(wasm_file):
+    """Return the instruction mix and the entry point of the module.
+
+    The entry point is the function FuzzDifferential runs: the first exported
+    function by name, invoked with zeros. Returns None if the module cannot
+    be printed.
+    """
+    import re
+    proc = await asyncio.create_subprocess_exec(
+        "wasm-tools", "print", wasm_file,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+    stdout, _ = await proc.communicate()
+    if proc.returncode != 0:
+        return None
+
+    mix = dict.fromkeys(INSTRUCTION_CATEGORIES, 0)
+    params = {}
+    exports = []
+    for line in stdout.decode(errors="replace").splitlines():
+        line = line.strip()
+        match = re.match(r"\(func \(;(\d+);\)", line)
+        if match:
+            params[match.group(1)] = [
+                param for group in re.findall(r"\(param ([^()]*)\)", line)
+                for param in group.split()
+            ]
+            continue
+        match = re.match(r'\(export "(.*)" \(func (\d+)\)\)', line)
+        if match:
+            exports.append((match.group(1), match.group(2)))
+            continue
+        if not line or line.startswith(("(", ")", ";;")):
+            continue
+        mix[instruction_category(line.split()[0])] += 1
+
+    profile = {
+        "functions": len(params), "instructions": sum(mix.values()),
+        "mix": mix,
+    }
+    if exports:
+        name, index = min(exports)
+        profile["entry"] = {"function": name, "params": params.get(index, [])}
+    return profile
+
+
+class PerfLog:
+    """Execution times of every module with its instruction mix.
+
+    Each module is appended to `path` as a JSON line, so that the ratio of
+    WasmKit to the reference engine can be related to what the module runs
+    across campaigns. The instruction mix is counted by background tasks
+    from a link to the module in `work_dir`, so that lanes do not wait for
+    `wasm-tools print`. When the queue is full, the module is logged without
+    its mix instead of blocking.
+    """
+
+    def __init__(self, path, min_time, work_dir, jobs=1, queue_size=64):
+        import collections
+        self.path = path
+        self.min_time = min_time
+        self.work_dir = work_dir
+        self.jobs = jobs
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.tasks = []
+        self.logged = 0
+        self.submitted = 0
+        self.unprofiled = 0
+        # (ratio, instruction shares) of modules slow enough to compare
+        self.recent = collections.deque(maxlen=10000)
+
+    def start(self):
+        os.makedirs(self.work_dir, exist_ok=True)
+        self.tasks = [
+            asyncio.create_task(self.work()) for _ in range(self.jobs)
+        ]
+
+    def submit(self, wasm_file, module, timings):
+        """Log the module, profiling it in the background if there is room."""
+        if self.queue.full():
+            self.unprofiled += 1
+            self.record(module, timings, None)
+            return
+        self.submitted += 1
+        link = os.path.join(self.work_dir, f"perf-{self.submitted}.wasm")
+        try:
+            os.link(wasm_file, link)
+        except OSError:
+            # e.g. the module directory is on another file system
+            shutil.copy(wasm_file, link)
+        self.queue.put_nowait((link, module, timings))
+
+    async def work(self):
+        while True:
+            link, module, timings = await self.queue.get()
+            try:
+                profile = await module_profile(link)
+                self.record(module, timings, profile)
+            finally:
+                os.remove(link)
+                self.queue.task_done()
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        # Log what is left without profiling it, not to delay the exit
+        while not self.queue.empty():
+            link, module, timings = self.queue.get_nowait()
+            self.unprofiled += 1
+            self.record(module, timings, None)
+            os.remove(link)
+
+    def record(self, module, timings, profile):
+        import json
+        wasmkit = timings[WASMKIT_ENGINE]
+        reference = timings[REFERENCE_ENGINE]
+        ratio = wasmkit / max(reference, 1e-6)
+        entry = {
+            "module": module, "wasmkit_seconds": wasmkit,
+            "reference_seconds": reference, "ratio": ratio,
+        }
+        if profile is not None:
+            entry.update(
+                functions=profile["functions"],
+                instructions=profile["instructions"], mix=profile["mix"])
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+        self.logged += 1
+        if profile is not None and profile["instructions"] and \
+                wasmkit >= self.min_time:
+            total = profile["instructions"]
+            self.recent.append((ratio, {
+                category: count / total
+                for category, count in profile["mix"].items()
+            }))
+
+    def summary_lines(self):
+        import statistics
+        lines = [f"Logged execution times of {self.logged} modules to {self.path}"
+                 f" ({self.unprofiled} without their instruction mix)"]
+        if len(self.recent) < 10:
+            return lines
+        ranked = sorted(self.recent, key=lambda item: -item[0])
+        worst = ranked[:max(1, len(ranked) // 10)]
+        ratios = [ratio for ratio, _ in ranked]
+        lines.append(
+            f"WasmKit/reference ratio over {len(ranked)} modules:"
+            f" median {statistics.median(ratios):.1f}x,"
+            f" worst 10% from {worst[-1][0]:.1f}x")
+        lines.append(f"{'category':<10} {'share':>8} {'worst 10%':>10}")
+        for category in INSTRUCTION_CATEGORIES:
+            share = statistics.mean(mix[category] for _, mix in ranked)
+            worst_share = statistics.mean(mix[category] for _, mix in worst)
+            lines.append(f"{category:<10} {share:>7.1%} {worst_share:>10.1%}")
+        return lines
+
+
+class ExecutionTimes:
+    """Execution times of the modules, from which the timeout is derived.
+
+    The timeout is a high percentile of recent times scaled by a factor, so
+    that hangs are cut short instead of pinning a lane for the maximum
+    timeout while slow but terminating modules still get room.
+    """
+
+    MIN_SAMPLES = 100
+
+    def __init__(self, num_lanes, percentile, factor, min_timeout, max_timeout):
+        import collections
+        self.percentile = percentile
+        self.factor = factor
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.recent = collections.deque(maxlen=1000)
+        # Counts by the power of two of milliseconds bounding the time
+        self.histograms = [collections.Counter() for _ in range(num_lanes)]
+
+    def record(self, lane, seconds):
+        import math
+        self.recent.append(seconds)
+        bucket = max(0, math.ceil(math.log2(max(seconds * 1000, 1e-3))))
+        self.histograms[lane][bucket] += 1
+
+    def quantile(self, percentile):
+        times = sorted(self.recent)
+        return times[min(len(times) - 1, int(len(times) * percentile / 100))]
+
+    @property
+    def timeout(self):
+        if len(self.recent) < self.MIN_SAMPLES:
+            return self.max_timeout
+        timeout = self.quantile(self.percentile) * self.factor
+        return min(self.max_timeout, max(self.min_timeout, timeout))
+
+    def summary(self):
+        if not self.recent:
+            return f"Timeout {self.timeout:.1f}s"
+        return (f"Timeout {self.timeout:.1f}s"
+                f" (p50 {self.quantile(50) * 1000:.1f}ms,"
+                f" p{self.percentile:g} {self.quantile(self.percentile) * 1000:.1f}ms)")
+
+    def histogram_lines(self):
+        buckets = sorted(set().union(*self.histograms))
+        if not buckets:
+            return []
+        lines = ["Execution time histogram (count of modules up to each time):",
+                 "lane " + "".join(f"{2 ** b:>8}ms" for b in buckets)]
+        for lane, histogram in enumerate(self.histograms):
+            lines.append(f"{lane:4} " + "".join(
+                f"{histogram[b]:>10}" for b in buckets))
+        return lines
+
+
+class SlowInputs:
+    """Modules that WasmKit runs far slower than the reference engine.
+
+    They are kept apart from the failures in `directory`, ranked by the
+    ratio of the times each engine spent calling the exported function, up
+    to `keep` of the slowest. They point at performance cliffs of the
+    interpreter rather than at bugs.
+    """
+
+    def __init__(self, directory, ratio, min_time, keep):
+        import json
+        self.directory = directory
+        self.path = directory.rstrip(os.sep) + ".index.json"
+        self.ratio = ratio
+        self.min_time = min_time
+        self.keep = keep
+        self.found = 0
+        self.inputs = []
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.inputs = json.load(f)
+
+    def ratio_of(self, timings):
+        """Return the ratio of the times if the module counts as slow."""
+        wasmkit = timings.get(WASMKIT_ENGINE)
+        reference = timings.get(REFERENCE_ENGINE)
+        if wasmkit is None or reference is None or wasmkit < self.min_time:
+            return None
+        ratio = wasmkit / max(reference, 1e-6)
+        return ratio if ratio >= self.ratio else None
+
+    def would_keep(self, timings):
+        """Whether `check` would keep a module with these timings."""
+        ratio = self.ratio_of(timings)
+        if ratio is None:
+            return False
+        return len(self.inputs) < self.keep or ratio > self.inputs[-1]["ratio"]
+
+    def check(self, wasm_file, module, timings, profile=None):
+        """Keep the module if it is slow enough; returns whether it was kept.
 
-    # Run the target program with a timeout of 60 seconds
-    found = False
+        The `profile` of the module from `module_profile` is saved with it,
+        which lets bench.py replay the module.
+        """
+        ratio = self.ratio_of(timings)
+        if ratio is None:
+            return False
+        wasmkit = timings[WASMKIT_ENGINE]
+        reference = timings[REFERENCE_ENGINE]
+        self.found += 1
+        if not self.would_keep(timings):
+            return False
+
+        os.makedirs(self.directory, exist_ok=True)
+        saved = dump_crash_wasm(wasm_file, "slow", self.directory)
+        name = os.path.basename(saved)
+        if any(entry["file"] == name for entry in self.inputs):
+            return False
+        self.inputs.append({
+            "file": name, "ratio": ratio, "module": module,
+            "wasmkit_seconds": wasmkit, "reference_seconds": reference,
+            **(profile or {}),
+        })
+        self.inputs.sort(key=lambda entry: -entry["ratio"])
+        for evicted in self.inputs[self.keep:]:
+            os.remove(os.path.join(self.directory, evicted["file"]))
+        del self.inputs[self.keep:]
+        self.save()
+        return True
+
+    def save(self):
+        import json
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.inputs, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class LaneContext:
+    """What the lanes share while checking modules."""
+
+    def __init__(self, program, buckets, shrink_pool, pipeline, times,
+                 slow_inputs, perf_log=None):
+        self.program = program
+        self.buckets = buckets
+        self.shrink_pool = shrink_pool
+        self.pipeline = pipeline
+        self.times = times
+        self.slow_inputs = slow_inputs
+        self.perf_log = perf_log
+
+
+async def run_single(lane, i, context, worker=None):
+    program = context.program
+    buckets, shrink_pool = context.buckets, context.shrink_pool
+    wasm_file, module = await context.pipeline.take()
+    start = time.monotonic()
+
+    # Run the target program with a timeout adapted to recent modules
+    timeout = context.times.timeout
+    verdict = "skipped"
     crash_file = None
     try:
-        proc = await asyncio.create_subprocess_exec(program, wasm_file)
-        await asyncio.wait_for(proc.wait(), timeout=60)
-        if proc.returncode != 0:
-            found = True
-            # If the target program fails, try to shrink the testcase
+        if worker is not None:
+            verdict, output = await worker.check(wasm_file, timeout=timeout)
+        else:
+            proc = await asyncio.create_subprocess_exec(
+                program, wasm_file,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT)
             try:
-                shrinked = f"{wasm_file}.shrink"
-                await shrink_testcase(wasm_file, program, shrinked)
-                crash_file = dump_crash_wasm(shrinked, "diff")
-            except subprocess.CalledProcessError:
-                # If shrinking fails, just dump the original testcase
-                crash_file = dump_crash_wasm(wasm_file, "diff")
+                stdout, _ = await asyncio.wait_for(
+                    proc.communicate(), timeout=timeout)
+            except TimeoutError:
+                proc.kill()
+                await proc.wait()
+                raise
+            output = stdout.decode(errors="replace").splitlines()
+            verdict = {0: "ok", 1: "diff"}.get(proc.returncode, "crash")
+        context.times.record(lane, time.monotonic() - start)
+        output, timings = split_timings(output)
+        if verdict != "ok":
+            crash_file = record_failure(
+                wasm_file, verdict, output, buckets, shrink_pool)
+        timed = WASMKIT_ENGINE in timings and REFERENCE_ENGINE in timings
+        if timed and context.perf_log is not None:
+            context.perf_log.submit(wasm_file, module, timings)
+        profile = None
+        if timed and context.slow_inputs.would_keep(timings):
+            # Kept modules are rare, so they are profiled right away
+            profile = await module_profile(wasm_file)
+        context.slow_inputs.check(wasm_file, module, timings, profile)
+    # TimeoutError is an OSError since Python 3.11, so it is handled first
+    except TimeoutError:
+        verdict = "timeout"
+        timeout_file = record_failure(
+            wasm_file, "timeout", [], buckets, shrink_pool)
+        if timeout_file is not None:
+            print(f"Timeout after {timeout:.1f}s in iteration {i}"
+                  f" (module {module});"
+                  f" reproduce with {program} {timeout_file})")
     except OSError as e:
         import errno
         if e.errno == errno.ETXTBSY:
@@ -85,22 +709,150 @@ async def run_single(lane, i, program):
             pass
         else:
             raise e
-
-    except TimeoutError:
-        timeout_file = os.path.join(fail_dir, f"timeout-{i}.wasm")
-        shutil.copy(wasm_file, timeout_file)
-        print(f"Timeout in iteration {i};"
-              f" reproduce with {program} {timeout_file})")
     except KeyboardInterrupt:
         print("Interrupted by user")
         exit(0)
+    finally:
+        os.remove(wasm_file)
+        context.pipeline.execute_time += time.monotonic() - start
+
+    return (lane, i, module, verdict, crash_file)
+
+
+class CampaignState:
+    """Counters of a differential testing campaign.
+
+    They are saved to `path` periodically and on exit, and loaded back when
+    the campaign is started again so that it resumes where it stopped. The
+    seed of every module is derived from the campaign seed and the module
+    number, so a finding can be regenerated from its number alone.
+    """
+
+    FINDINGS = ("diff", "crash", "timeout")
+
+    def __init__(self, path, num_lanes):
+        self.path = path
+        self.seed = os.urandom(16).hex()
+        self.next_module = 0
+        self.iterations = 0
+        self.findings = {kind: 0 for kind in self.FINDINGS}
+        # Module numbers and reproducers of findings kept by the buckets
+        self.finding_modules = []
+        self.elapsed = 0.0
+        self.lane_rates = {}
+        self.resumed = os.path.exists(path)
+        if self.resumed:
+            import json
+            with open(path) as f:
+                state = json.load(f)
+            for key in ("seed", "next_module", "iterations", "findings",
+                        "finding_modules", "elapsed", "lane_rates"):
+                setattr(self, key, state[key])
+
+        self.session_start = time.monotonic()
+        self.session_elapsed_base = self.elapsed
+        self.interval_start = self.session_start
+        self.interval_iterations = [0] * num_lanes
+        self.interval_findings = {kind: 0 for kind in self.FINDINGS}
+
+    def module_seed(self, module):
+        import hashlib
+        return hashlib.shake_256(f"{self.seed}:{module}".encode()).digest(100)
+
+    def complete(self, lane, module, verdict, repro):
+        if verdict == "skipped":
+            return
+        self.iterations += 1
+        self.interval_iterations[lane] += 1
+        if verdict in self.findings:
+            self.findings[verdict] += 1
+            self.interval_findings[verdict] += 1
+        if repro is not None:
+            self.finding_modules.append(
+                {"module": module, "verdict": verdict, "file": repro})
 
-    return (lane, i, found, crash_file)
+    def sample(self):
+        """Return the metrics since the previous sample and start a new interval."""
+        now = time.monotonic()
+        interval = max(now - self.interval_start, 1e-9)
+        self.elapsed = self.session_elapsed_base + (now - self.session_start)
+        self.lane_rates = {
+            str(lane): count / interval
+            for lane, count in enumerate(self.interval_iterations)
+        }
+        executed = sum(self.interval_iterations)
+        metrics = {
+            "time": time.time(),
+            "iterations": self.iterations,
+            "elapsed": self.elapsed,
+            "executions_per_sec": executed / interval,
+            "timeouts": self.findings["timeout"],
+            "diffs": self.findings["diff"],
+            "crashes": self.findings["crash"],
+            "diff_rate": self.interval_findings["diff"] / executed if executed else 0.0,
+            "lane_executions_per_sec": self.lane_rates,
+        }
+        self.interval_start = now
+        self.interval_iterations = [0] * len(self.interval_iterations)
+        self.interval_findings = {kind: 0 for kind in self.FINDINGS}
+        return metrics
+
+    def save(self):
+        import json
+        state = {
+            key: getattr(self, key)
+            for key in ("seed", "next_module", "iterations", "findings",
+                        "finding_modules", "elapsed", "lane_rates")
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def write_metrics(path, metrics_format, metrics):
+    """Append the metrics as a JSON line, or rewrite them as a Prometheus
+    text file for the node exporter's textfile collector."""
+    import json
+    if metrics_format == "jsonl":
+        with open(path, "a") as f:
+            f.write(json.dumps(metrics) + "\n")
+        return
+
+    lines = []
+
+    def metric(name, kind, help, samples):
+        lines.append(f"# HELP wasmkit_differential_{name} {help}")
+        lines.append(f"# TYPE wasmkit_differential_{name} {kind}")
+        for labels, value in samples:
+            lines.append(f"wasmkit_differential_{name}{labels} {value}")
+
+    metric("iterations_total", "counter", "Modules checked.",
+           [("", metrics["iterations"])])
+    metric("findings_total", "counter", "Modules that failed, by kind.",
+           [(f'{{kind="{kind}"}}', metrics[key]) for kind, key in
+            (("diff", "diffs"), ("crash", "crashes"), ("timeout", "timeouts"))])
+    metric("executions_per_second", "gauge", "Modules checked per second.",
+           [("", metrics["executions_per_sec"])])
+    metric("diff_rate", "gauge", "Share of recent modules that diverged.",
+           [("", metrics["diff_rate"])])
+    metric("lane_executions_per_second", "gauge",
+           "Modules checked per second by each lane.",
+           [(f'{{lane="{lane}"}}', rate) for lane, rate in
+            metrics["lane_executions_per_sec"].items()])
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
 
 
 class Progress:
     def __init__(self):
         self.i = 0
+        self.start_i = 0
+
+    def resume(self, iterations):
+        self.i = self.start_i = iterations
 
     def start_new(self, lane):
         new = self.i
@@ -110,6 +862,9 @@ class Progress:
     def complete(self, i, lane, found, repro):
         pass
 
+    def show_pipeline(self, summary):
+        pass
+
     def finalize(self):
         pass
 
@@ -122,9 +877,12 @@ class StdoutProgress(Progress):
     def complete(self, i, lane, found, repro):
         if self.i % 100 == 0:
             elapsed_time = time.time() - self.start_time
-            iter_per_sec = self.i / elapsed_time
+            iter_per_sec = (self.i - self.start_i) / elapsed_time
             print(f"#{self.i} (iter/s: {iter_per_sec:.2f})")
 
+    def show_pipeline(self, summary):
+        print(summary)
+
 
 class CursesProgress(Progress):
     def __init__(self, max_lanes, program, curses):
@@ -137,6 +895,7 @@ class CursesProgress(Progress):
         # For printing help for reproducing the last crash
         self.program = program
         self.found_diffs = 0
+        self.pipeline_summary = ""
         self.show_overview()
 
     def start_new(self, lane):
@@ -169,10 +928,19 @@ class CursesProgress(Progress):
             self.found_diffs += 1
             self.show_overview()
 
+    def show_pipeline(self, summary):
+        self.pipeline_summary = summary
+        self.show_overview()
+
     def show_overview(self):
-        self.overview_lines = 1
-        self.stdscr.addstr(0, 0, f"Found {self.found_diffs} diffs")
-        self.stdscr.refresh()
+        self.overview_lines = 2
+        try:
+            self.stdscr.addstr(0, 0, f"Found {self.found_diffs} diffs")
+            self.stdscr.addstr(1, 0, self.pipeline_summary)
+            self.stdscr.clrtoeol()
+            self.stdscr.refresh()
+        except self.curses.error:
+            pass
 
     def finalize(self):
         self.curses.echo()
@@ -180,27 +948,93 @@ class CursesProgress(Progress):
         self.curses.endwin()
 
 
+REPORT_INTERVAL = 10
+
+
 async def run(args, progress, num_lanes):
     os.makedirs(tmp_dir, exist_ok=True)
+    os.makedirs(fail_dir, exist_ok=True)
 
+    campaign = CampaignState(args.state_file, num_lanes)
+    if campaign.resumed:
+        print(f"Resuming campaign at iteration {campaign.iterations}"
+              f" (module {campaign.next_module})")
+        progress.resume(campaign.iterations)
+
+    workers = [
+        BatchWorker(args.program, args.batch_size,
+                    os.path.join(tmp_dir, f"t{i}.stderr"))
+        if args.batch_size > 0 else None
+        for i in range(num_lanes)
+    ]
+    buckets = BucketIndex(fail_dir)
+    pipeline = ModulePipeline(
+        args.generators, args.module_queue, args.module_dir, campaign)
+    pipeline.start()
+    shrink_pool = ShrinkPool(
+        args.program, buckets, args.shrink_jobs, args.shrink_queue,
+        args.shrink_timeout)
+    shrink_pool.start()
+    times = ExecutionTimes(
+        num_lanes, args.timeout_percentile, args.timeout_factor,
+        args.min_timeout, args.max_timeout)
+    slow_inputs = SlowInputs(
+        args.slow_dir, args.slow_ratio, args.slow_min_time, args.slow_keep)
+    perf_log = None
+    if args.perf:
+        perf_log = PerfLog(args.perf_log, args.slow_min_time,
+                           os.path.join(tmp_dir, "perf"))
+        perf_log.start()
+    context = LaneContext(
+        args.program, buckets, shrink_pool, pipeline, times, slow_inputs,
+        perf_log)
     lanes = [
         asyncio.create_task(run_single(
-            i, progress.start_new(i), args.program
+            i, progress.start_new(i), context, workers[i]
         )) for i in range(num_lanes)
     ]
 
+    def report(show_pipeline=True):
+        if show_pipeline:
+            progress.show_pipeline(
+                pipeline.summary(num_lanes) + "; " + times.summary())
+        metrics = campaign.sample()
+        metrics["timeout_seconds"] = times.timeout
+        metrics["slow_inputs"] = slow_inputs.found
+        if args.metrics_file:
+            write_metrics(args.metrics_file, args.metrics_format, metrics)
+        campaign.save()
+
+    # Tasks that run until they are stopped; if one of them fails, e.g.
+    # because wasm-tools is missing, the campaign stops with its error
+    # instead of lanes waiting forever
+    background = pipeline.tasks + shrink_pool.tasks
+    if perf_log is not None:
+        background += perf_log.tasks
+
+    last_report = time.monotonic()
     try:
         while True:
             # Run the target program with a timeout of 60 seconds
             try:
                 done, pending = await asyncio.wait(
-                    lanes, return_when=asyncio.FIRST_COMPLETED)
+                    lanes + background, timeout=REPORT_INTERVAL,
+                    return_when=asyncio.FIRST_COMPLETED)
+                if time.monotonic() - last_report >= REPORT_INTERVAL:
+                    report()
+                    last_report = time.monotonic()
+                for task in done:
+                    if task in background:
+                        task.result()
+                        raise RuntimeError("a background task stopped")
                 for result in done:
-                    lane, task_id, found, repro = result.result()
+                    lane, task_id, module, verdict, repro = result.result()
+                    campaign.complete(lane, module, verdict, repro)
+                    found = verdict in ("diff", "crash")
                     progress.complete(task_id, lane, found, repro)
                     lanes[lane] = asyncio.create_task(
                         run_single(lane, progress.start_new(lane),
-                                   args.program)
+                                   context, workers[lane])
                     )
             except KeyboardInterrupt:
                 print("Interrupted by user")
@@ -209,7 +1043,33 @@ async def run(args, progress, num_lanes):
         print("Cleaning up...")
         for lane in lanes:
             lane.cancel()
+        for worker in workers:
+            if worker is not None:
+                await worker.stop()
+        await shrink_pool.stop()
+        if perf_log is not None:
+            await perf_log.stop()
+        await pipeline.stop()
+        report(show_pipeline=False)
         progress.finalize()
+        print(pipeline.summary(num_lanes))
+        print(times.summary())
+        for line in times.histogram_lines():
+            print(line)
+        print(f"{slow_inputs.found} modules ran at least {args.slow_ratio:g}x"
+              f" slower on WasmKit than on the reference engine;"
+              f" the slowest are in {slow_inputs.path}")
+        if perf_log is not None:
+            for line in perf_log.summary_lines():
+                print(line)
+        print(f"Campaign state saved to {args.state_file};"
+              f" {campaign.iterations} iterations in"
+              f" {campaign.elapsed:.0f}s, findings: {campaign.findings}")
+        print(f"Shrunk {shrink_pool.shrunk} testcases;"
+              f" {shrink_pool.queue.qsize()} left in the queue and"
+              f" {shrink_pool.dropped} skipped because it was full")
+        print(f"{len(buckets.buckets)} distinct failures;"
+              f" see {buckets.path}")
 
 
 def derive_progress(args):
@@ -225,6 +1085,7 @@ def derive_progress(args):
 
 
 def main():
+    global tmp_dir, fail_dir
     import argparse
     parser = argparse.ArgumentParser(description="Fuzz differential testing")
     default_program = os.path.join(
@@ -237,12 +1098,126 @@ def main():
         "-j", "--jobs", type=int, default=os.cpu_count(),
         help="Number of parallel jobs"
     )
+    parser.add_argument(
+        "--generators", type=int, default=max(1, os.cpu_count() // 4),
+        help="Number of wasm-smith processes generating modules ahead of the"
+             " lanes"
+    )
+    parser.add_argument(
+        "--module-queue", type=int, default=64,
+        help="Number of generated modules waiting to be executed before"
+             " generators pause"
+    )
+    parser.add_argument(
+        "--module-dir",
+        help="Directory to keep generated modules in, e.g. on a tmpfs"
+             " (default: <work-dir>/modules)"
+    )
+    parser.add_argument(
+        "--work-dir", default=tmp_dir,
+        help="Directory for temporary files of the lanes"
+    )
+    parser.add_argument(
+        "--fail-dir", default=fail_dir,
+        help="Directory to save failing testcases in"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=1000,
+        help="Number of modules each long-lived worker process checks before"
+             " being respawned; 0 spawns a process per module"
+    )
+    parser.add_argument(
+        "--shrink-jobs", type=int, default=1,
+        help="Number of testcases shrunk concurrently; 0 disables shrinking"
+    )
+    parser.add_argument(
+        "--shrink-queue", type=int, default=16,
+        help="Number of testcases waiting to be shrunk before new ones are"
+             " kept unshrunk"
+    )
+    parser.add_argument(
+        "--shrink-timeout", type=float, default=300,
+        help="Seconds a single shrink may take before it is abandoned"
+    )
+    parser.add_argument(
+        "--max-timeout", type=float, default=60,
+        help="Seconds a module may run before it is considered a timeout;"
+             " also the timeout until enough modules have been timed"
+    )
+    parser.add_argument(
+        "--min-timeout", type=float, default=5,
+        help="Lower bound of the adaptive timeout in seconds"
+    )
+    parser.add_argument(
+        "--timeout-percentile", type=float, default=99,
+        help="Percentile of recent execution times the timeout is based on"
+    )
+    parser.add_argument(
+        "--timeout-factor", type=float, default=10,
+        help="Multiple of the percentile used as the timeout"
+    )
+    parser.add_argument(
+        "--slow-ratio", type=float, default=20,
+        help="Keep modules that run this many times slower on WasmKit than"
+             " on the reference engine as slow inputs"
+    )
+    parser.add_argument(
+        "--slow-min-time", type=float, default=0.05,
+        help="Seconds WasmKit must take on a module for it to count as slow"
+    )
+    parser.add_argument(
+        "--slow-keep", type=int, default=50,
+        help="Number of the slowest inputs to keep"
+    )
+    parser.add_argument(
+        "--slow-dir",
+        help="Directory to keep slow inputs in (default: <fail-dir>-slow)"
+    )
+    parser.add_argument(
+        "--perf", action="store_true",
+        help="Log the execution times and instruction mix of every module"
+             " and summarize which instructions WasmKit is slow at"
+    )
+    parser.add_argument(
+        "--perf-log",
+        help="File to append the per-module log of --perf to"
+             " (default: <work-dir>/perf.jsonl)"
+    )
     parser.add_argument(
         "--progress", choices=["stdout", "curses"], default="curses",
         help="Progress display mode"
     )
+    parser.add_argument(
+        "--state-file",
+        help="File to persist the campaign state in; an existing one is"
+             " resumed (default: <work-dir>/campaign.json)"
+    )
+    parser.add_argument(
+        "--reset-state", action="store_true",
+        help="Start a new campaign instead of resuming the saved one"
+    )
+    parser.add_argument(
+        "--metrics-file",
+        help="File to export throughput and finding metrics to every"
+             f" {REPORT_INTERVAL} seconds"
+    )
+    parser.add_argument(
+        "--metrics-format", choices=["jsonl", "prometheus"], default="jsonl",
+        help="Append JSON lines, or rewrite a Prometheus text file"
+    )
 
     args = parser.parse_args()
+    tmp_dir, fail_dir = args.work_dir, args.fail_dir
+    if args.module_dir is None:
+        args.module_dir = os.path.join(tmp_dir, "modules")
+    if args.slow_dir is None:
+        args.slow_dir = fail_dir.rstrip(os.sep) + "-slow"
+    if args.perf_log is None:
+        args.perf_log = os.path.join(tmp_dir, "perf.jsonl")
+    if args.state_file is None:
+        args.state_file = os.path.join(tmp_dir, "campaign.json")
+    if args.reset_state and os.path.exists(args.state_file):
+        os.remove(args.state_file)
 
     progress = derive_progress(args)
     asyncio.run(run(args, progress, args.jobs))
@@ -56,39 +56,320 @@ def main():
     run_parser.add_argument(
         '--skip-build', action='store_true',
         help='Skip building the fuzzer')
+    run_parser.add_argument(
+        '-j', '--jobs', type=int, default=2,
+        help='Number of fuzzing processes forked by libFuzzer')
+    run_parser.add_argument(
+        '--corpus-dir', default='./.build/fuzz-corpus',
+        help='Corpus directory to read seeds from and add new inputs to')
+    run_parser.add_argument(
+        '--artifact-dir', help='Directory to save crashes in'
+        ' (default: ./FailCases/<target>)')
     run_parser.add_argument(
         'args', nargs=argparse.REMAINDER,
         help='Arguments to pass to the fuzzer')
-    run_parser.set_defaults(func=run)
+    run_parser.set_defaults(func=run, sanitizer='address')
+
+    triage_parser = subparsers.add_parser(
+        'triage', help='Group the crashes found by the fuzzer into buckets')
+    triage_parser.add_argument(
+        'target_name', type=str, help='Name of the target', choices=available_targets)
+    triage_parser.add_argument(
+        '--skip-build', action='store_true',
+        help='Skip building the fuzzer')
+    triage_parser.add_argument(
+        '--keep-artifacts', action='store_true',
+        help='Keep testcases that are not the smallest of their bucket')
+    triage_parser.add_argument(
+        '--artifact-dir', help='Directory of the crashes to triage'
+        ' (default: ./FailCases/<target>)')
+    triage_parser.set_defaults(func=triage, sanitizer='address')
 
     seed_parser = subparsers.add_parser(
         'seed', help='Generate seed corpus for the fuzzer')
+    seed_parser.add_argument(
+        '-n', '--count', type=int, default=100,
+        help='Number of seeds to generate')
+    seed_parser.add_argument(
+        '-j', '--jobs', type=int, default=os.cpu_count(),
+        help='Number of wasm-smith processes to run in parallel')
+    seed_parser.add_argument(
+        '--corpus-dir', default='./.build/fuzz-corpus',
+        help='Directory to write the seeds to')
+    seed_parser.add_argument(
+        '--smith-flag', action='append', default=[],
+        help='Flag to pass to wasm-tools smith, e.g.'
+        ' --smith-flag=--simd-enabled=true (repeatable)')
     seed_parser.set_defaults(func=seed)
 
+    minimize_parser = subparsers.add_parser(
+        'minimize',
+        help='Reduce the corpus to a minimal set with the same coverage')
+    minimize_parser.add_argument(
+        'target_name', type=str, help='Name of the target', choices=available_targets)
+    minimize_parser.add_argument(
+        '--skip-build', action='store_true',
+        help='Skip building the fuzzer')
+    minimize_parser.add_argument(
+        '-j', '--jobs', type=int, default=os.cpu_count(),
+        help='Number of shards merged in parallel')
+    minimize_parser.add_argument(
+        '--corpus-dir', default='./.build/fuzz-corpus',
+        help='Corpus directory to minimize in place')
+    minimize_parser.set_defaults(func=minimize, sanitizer='address')
+
+    coverage_parser = subparsers.add_parser(
+        'coverage',
+        help='Report the source coverage reached by the corpus')
+    coverage_parser.add_argument(
+        'target_name', type=str, help='Name of the target', choices=available_targets)
+    coverage_parser.add_argument(
+        '--skip-build', action='store_true',
+        help='Skip building the fuzzer with coverage instrumentation')
+    coverage_parser.add_argument(
+        '-j', '--jobs', type=int, default=os.cpu_count(),
+        help='Number of shards of the corpus replayed in parallel')
+    coverage_parser.add_argument(
+        '--corpus-dir', default='./.build/fuzz-corpus',
+        help='Corpus directory to replay')
+    coverage_parser.add_argument(
+        '--source-filter', default='Sources/WasmKit/',
+        help='Only report source files whose path contains this string')
+    coverage_parser.add_argument(
+        '--output-dir',
+        help='Directory for the reports (default: ./.build/fuzz-coverage/<target>)')
+    coverage_parser.set_defaults(func=coverage, sanitizer='coverage')
+
     args = parser.parse_args()
     runner = CommandRunner(verbose=args.verbose, dry_run=args.dry_run)
     args.func(args, runner)
 
 
 def seed(args, runner):
+    from concurrent.futures import ThreadPoolExecutor
+
+    smith_flags = args.smith_flag
+
     def generate_seed_corpus(output_path: str):
         args = [
             "wasm-tools", "smith", "-o", output_path
-        ]
+        ] + smith_flags
         # Random stdin input
         stdin = os.urandom(1024)
-        process = subprocess.Popen(args, stdin=subprocess.PIPE)
-        process.communicate(input=stdin)
-        if process.returncode != 0:
+        process = runner.run(args, input=stdin)
+        if process is not None and process.returncode != 0:
             raise Exception(f"Failed to generate seed corpus: {output_path}")
+        return output_path
 
-    output_dir = ".build/fuzz-corpus"
+    output_dir = args.corpus_dir
     os.makedirs(output_dir, exist_ok=True)
 
-    for i in range(100):
-        output = f"{output_dir}/corpus-{i}.wasm"
-        generate_seed_corpus(output)
-        print(f"Generated seed corpus: {output}")
+    outputs = [f"{output_dir}/corpus-{i}.wasm" for i in range(args.count)]
+    # Each task only waits on its wasm-smith process, so threads are enough
+    # to keep the processes running in parallel
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        for output in executor.map(generate_seed_corpus, outputs):
+            print(f"Generated seed corpus: {output}")
+
+
+def shard_corpus(corpus_dir: str, work_dir: str, num_shards: int):
+    """Split the corpus into disjoint shard directories of hard links."""
+    inputs = sorted(os.listdir(corpus_dir))
+    num_shards = max(1, min(num_shards, len(inputs)))
+    shards = []
+    for i in range(num_shards):
+        shard = os.path.join(work_dir, f'shard-{i}')
+        os.makedirs(shard)
+        for name in inputs[i::num_shards]:
+            os.link(os.path.join(corpus_dir, name), os.path.join(shard, name))
+        shards.append(shard)
+    return shards
+
+
+def make_work_dir(corpus_dir: str, prefix: str) -> str:
+    import tempfile
+    # Next to the corpus so that inputs can be hard-linked and renamed
+    return tempfile.mkdtemp(
+        prefix=prefix, dir=os.path.dirname(os.path.abspath(corpus_dir)))
+
+
+def minimize(args, runner: CommandRunner):
+    from concurrent.futures import ThreadPoolExecutor
+    import shutil
+
+    if not args.skip_build:
+        build(args, runner)
+
+    corpus_dir = os.path.normpath(args.corpus_dir)
+    inputs = os.listdir(corpus_dir)
+    work_dir = make_work_dir(corpus_dir, 'fuzz-minimize-')
+    print(f'Minimizing {len(inputs)} inputs in {corpus_dir}')
+
+    # Merge disjoint shards in parallel first, so that the final merge
+    # only has to go through the inputs each shard kept
+    shard_outputs = []
+    for shard in shard_corpus(corpus_dir, work_dir, args.jobs):
+        os.makedirs(shard + '-merged')
+        shard_outputs.append((shard, shard + '-merged'))
+
+    def merge(output, *input_dirs):
+        merge_args = [
+            executable_path(args.target_name), '-merge=1',
+            '-timeout=5', '-rss_limit_mb=5368709120',
+            output, *input_dirs,
+        ]
+        process = runner.run(
+            merge_args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            env={'SWIFT_BACKTRACE': 'enable=off'})
+        if process is not None and process.returncode != 0:
+            raise Exception(f'Failed to merge into {output}')
+
+    with ThreadPoolExecutor(max_workers=len(shard_outputs)) as executor:
+        list(executor.map(lambda shard: merge(shard[1], shard[0]), shard_outputs))
+
+    minimized_dir = os.path.join(work_dir, 'merged')
+    os.makedirs(minimized_dir)
+    merge(minimized_dir, *(output for _, output in shard_outputs))
+
+    if runner.dry_run:
+        shutil.rmtree(work_dir)
+        return
+    kept = len(os.listdir(minimized_dir))
+    # Swap the directories so that the corpus is never left half-written
+    old_dir = os.path.join(work_dir, 'old')
+    os.rename(corpus_dir, old_dir)
+    os.rename(minimized_dir, corpus_dir)
+    shutil.rmtree(work_dir)
+    print(f'Minimized corpus from {len(inputs)} to {kept} inputs')
+
+
+def llvm_tool(name: str) -> str:
+    """Find an LLVM tool, preferring the one shipped with the Swift toolchain."""
+    import shutil
+    swift = shutil.which('swift')
+    if swift is not None:
+        candidate = os.path.join(os.path.dirname(os.path.realpath(swift)), name)
+        if os.path.exists(candidate):
+            return candidate
+    return name
+
+
+def coverage(args, runner: CommandRunner):
+    from concurrent.futures import ThreadPoolExecutor
+    import csv
+    import json
+    import shutil
+    import time
+
+    if not args.skip_build:
+        build(args, runner)
+
+    corpus_dir = os.path.normpath(args.corpus_dir)
+    output_dir = args.output_dir or f'./.build/fuzz-coverage/{args.target_name}'
+    os.makedirs(output_dir, exist_ok=True)
+    work_dir = make_work_dir(corpus_dir, 'fuzz-coverage-')
+    executable = executable_path(args.target_name)
+    shards = shard_corpus(corpus_dir, work_dir, args.jobs)
+    print(f'Replaying {sum(len(os.listdir(s)) for s in shards)} inputs'
+          f' in {len(shards)} shards')
+
+    def replay(shard):
+        # -runs=0 executes every input of the corpus once without fuzzing
+        replay_args = [
+            executable, '-runs=0', '-timeout=5', '-rss_limit_mb=5368709120',
+            shard,
+        ]
+        env = {
+            'SWIFT_BACKTRACE': 'enable=off',
+            'LLVM_PROFILE_FILE': os.path.abspath(shard) + '-%p.profraw',
+        }
+        process = runner.run(
+            replay_args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            env=env)
+        if process is not None and process.returncode != 0:
+            # The profile of a crashed replay is lost, but others still count
+            print(f'Replaying {shard} failed; its coverage is not included')
+
+    profdata = os.path.join(output_dir, 'corpus.profdata')
+    try:
+        with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+            list(executor.map(replay, shards))
+
+        profraws = [os.path.join(work_dir, name) for name in os.listdir(work_dir)
+                    if name.endswith('.profraw')]
+        runner.run([llvm_tool('llvm-profdata'), 'merge', '-sparse', *profraws,
+                    '-o', profdata], check=True)
+        export = runner.run(
+            [llvm_tool('llvm-cov'), 'export', '-summary-only',
+             f'-instr-profile={profdata}', executable],
+            stdout=subprocess.PIPE, check=True)
+    finally:
+        shutil.rmtree(work_dir)
+    if export is None:
+        return
+
+    kinds = ['lines', 'branches', 'functions', 'regions']
+    files = [
+        file for file in json.loads(export.stdout)['data'][0]['files']
+        if args.source_filter in file['filename']
+    ]
+    files.sort(key=lambda file: file['filename'])
+    totals = {kind: [0, 0] for kind in kinds}
+    source_root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+    files_csv = os.path.join(output_dir, 'files.csv')
+    with open(files_csv, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['file'] + [f'{kind}_{column}' for kind in kinds
+                                    for column in ('covered', 'count')])
+        for file in files:
+            row = [os.path.relpath(file['filename'], source_root)]
+            for kind in kinds:
+                summary = file['summary'][kind]
+                row += [summary['covered'], summary['count']]
+                totals[kind][0] += summary['covered']
+                totals[kind][1] += summary['count']
+            writer.writerow(row)
+
+    def percent(covered, count):
+        return 100 * covered / count if count else 0
+
+    print(f'{"File":60} {"Lines":>8} {"Branches":>9}')
+    for file in files:
+        lines, branches = file['summary']['lines'], file['summary']['branches']
+        print(f'{os.path.relpath(file["filename"], source_root):60}'
+              f' {percent(lines["covered"], lines["count"]):7.1f}%'
+              f' {percent(branches["covered"], branches["count"]):8.1f}%')
+
+    # Append to the time series so that growth can be followed across runs
+    history_csv = os.path.join(output_dir, 'history.csv')
+    columns = ['time', 'corpus_size'] + [f'{kind}_{column}' for kind in kinds
+                                         for column in ('covered', 'count')]
+    history = []
+    if os.path.exists(history_csv):
+        with open(history_csv, newline='') as f:
+            history = list(csv.DictReader(f))
+    entry = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+             'corpus_size': len(os.listdir(corpus_dir))}
+    for kind in kinds:
+        entry[f'{kind}_covered'], entry[f'{kind}_count'] = totals[kind]
+    history.append(entry)
+    with open(history_csv, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(history)
+
+    print('Coverage over time:')
+    previous = None
+    for row in history[-10:]:
+        covered = int(row['lines_covered'])
+        growth = f' ({covered - previous:+})' if previous is not None else ''
+        print(f'  {row["time"]} corpus {row["corpus_size"]:>6}'
+              f' lines {covered}/{row["lines_count"]}'
+              f' ({percent(covered, int(row["lines_count"])):.1f}%){growth}'
+              f' branches {row["branches_covered"]}/{row["branches_count"]}')
+        previous = covered
+    print(f'Per-file coverage written to {files_csv}; history in {history_csv}')
 
 
 def executable_path(target_name: str) -> str:
@@ -138,11 +419,13 @@ def run(args, runner: CommandRunner):
 
     print('Running fuzzer')
 
-    artifact_dir = f'./FailCases/{args.target_name}/'
+    artifact_dir = args.artifact_dir or f'./FailCases/{args.target_name}'
+    artifact_dir = os.path.join(artifact_dir, '')
     os.makedirs(artifact_dir, exist_ok=True)
+    os.makedirs(args.corpus_dir, exist_ok=True)
     fuzzer_args = [
-        executable_path(args.target_name), './.build/fuzz-corpus',
-        '-fork=2',
+        executable_path(args.target_name), args.corpus_dir,
+        f'-fork={args.jobs}',
         '-timeout=5', '-ignore_timeouts=1',
         # Relax the RSS limit to 5GB (default is 4GB) to allow
         # allocating maximum memory for 32-bit space.
@@ -152,5 +435,36 @@ def run(args, runner: CommandRunner):
     runner.run(fuzzer_args, env={'SWIFT_BACKTRACE': 'enable=off'})
 
 
+def triage(args, runner: CommandRunner):
+    from triage import BucketIndex, LIBFUZZER_ARTIFACT_PATTERN, bucket_signature
+
+    if not args.skip_build:
+        build(args, runner)
+
+    artifact_dir = args.artifact_dir or f'./FailCases/{args.target_name}'
+    buckets = BucketIndex(artifact_dir)
+    known = buckets.reproducers()
+
+    for name in sorted(os.listdir(artifact_dir)):
+        match = LIBFUZZER_ARTIFACT_PATTERN.match(name)
+        if match is None or name in known:
+            continue
+        artifact = os.path.join(artifact_dir, name)
+        result = runner.run(
+            [executable_path(args.target_name), '-timeout=5', artifact],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            env={'SWIFT_BACKTRACE': 'enable=off'})
+        if result is None:
+            continue
+        output = result.stdout.decode('utf-8', errors='replace').splitlines()
+        signature = bucket_signature(match.group(1), output)
+        kept = buckets.add(artifact, signature, output,
+                           remove_duplicates=not args.keep_artifacts)
+        print(f'{name}: {signature[1]}{" (new reproducer)" if kept else ""}')
+
+    print(buckets.summary())
+    print(f'Index written to {buckets.path}')
+
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+import os
+import json
+import tempfile
+import unittest
+
+import differential
+
+
+# Output of `FuzzDifferential --batch` for one module, as printed by
+# `run(moduleFile:)` with the `name` of each engine
+BATCH_OUTPUT = [
+    "Value 0 does not match: wasmkit:i32(1) vs reference:i32(2)",
+    "#time wasmkit 0.25",
+    "#time reference 1.5e-05",
+]
+
+
+class SplitTimingsTests(unittest.TestCase):
+
+    def test_separates_time_lines(self):
+        output, timings = differential.split_timings(BATCH_OUTPUT)
+        self.assertEqual(output, BATCH_OUTPUT[:1])
+        self.assertEqual(timings, {
+            differential.WASMKIT_ENGINE: 0.25,
+            differential.REFERENCE_ENGINE: 1.5e-05,
+        })
+
+
+class SlowInputsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.wasm_file = os.path.join(self.tmp.name, "module.wasm")
+        with open(self.wasm_file, "wb") as f:
+            f.write(b"\0asm\1\0\0\0")
+        self.slow_inputs = differential.SlowInputs(
+            os.path.join(self.tmp.name, "slow"), ratio=20, min_time=0.05,
+            keep=2)
+
+    def test_keeps_module_from_batch_output(self):
+        _, timings = differential.split_timings(BATCH_OUTPUT)
+        self.assertTrue(self.slow_inputs.would_keep(timings))
+        self.assertTrue(self.slow_inputs.check(self.wasm_file, 7, timings))
+        self.assertEqual(self.slow_inputs.found, 1)
+
+        with open(self.slow_inputs.path) as f:
+            inputs = json.load(f)
+        self.assertEqual(len(inputs), 1)
+        self.assertEqual(inputs[0]["module"], 7)
+        self.assertEqual(inputs[0]["wasmkit_seconds"], 0.25)
+        self.assertTrue(os.path.exists(
+            os.path.join(self.slow_inputs.directory, inputs[0]["file"])))
+
+    def test_ignores_fast_module(self):
+        _, timings = differential.split_timings([
+            "#time wasmkit 0.25",
+            "#time reference 0.2",
+        ])
+        self.assertFalse(self.slow_inputs.would_keep(timings))
+        self.assertFalse(self.slow_inputs.check(self.wasm_file, 7, timings))
+        self.assertEqual(self.slow_inputs.found, 0)
+
+
+class PerfLogTests(unittest.TestCase):
+
+    def test_records_module_from_batch_output(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            perf_log = differential.PerfLog(
+                os.path.join(tmp, "perf.jsonl"), 0.05, os.path.join(tmp, "perf"))
+            _, timings = differential.split_timings(BATCH_OUTPUT)
+            perf_log.record(7, timings, None)
+            with open(perf_log.path) as f:
+                entry = json.loads(f.readline())
+        self.assertEqual(perf_log.logged, 1)
+        self.assertEqual(entry["module"], 7)
+        self.assertEqual(entry["reference_seconds"], 1.5e-05)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,189 @@
+"""Groups failures found by the fuzzing drivers into buckets by root cause.
+
+A failure's bucket is derived from the diagnostics printed while checking it:
+the first mismatch reported by FuzzDifferential, or the error line and the
+top stack frames of a crash. Numbers and addresses are normalized away so
+that the same bug hit by different inputs lands in the same bucket.
+"""
+import os
+import re
+import json
+import time
+
+# Frames that belong to the runtime, sanitizers, or the fuzzing harness and
+# tell nothing about where the bug is
+IGNORED_FRAME_PREFIXES = (
+    "__sanitizer", "__asan", "__lsan", "__ubsan", "__interceptor", "__libc",
+    "__GI_", "abort", "raise", "gsignal", "malloc", "calloc", "realloc",
+    "operator new", "swift_", "_swift_", "Swift._assertionFailure",
+    "Swift.fatalError", "_assertionFailure", "fatalError", "fuzzer::",
+    "LLVMFuzzerTestOneInput", "main", "__libc_start",
+)
+
+# Testcases saved by libFuzzer are named <kind>-<sha1 of the input>
+LIBFUZZER_ARTIFACT_PATTERN = re.compile(
+    r"^(crash|leak|oom|timeout|slow-unit)-[0-9a-f]{40}$")
+
+MAX_FRAMES = 3
+MAX_SAMPLE_LINES = 20
+
+FRAME_PATTERN = re.compile(
+    # ASan: "    #0 0x55d0 in foo /path/file.swift:12:3"
+    # Swift: " 0 [ra] 0x55d0 foo() + 12 in FuzzExecute at /path/file.swift:12:3"
+    r"^\s*\*?#?\d+\s+(?:\[\w+\]\s+)?0x[0-9a-fA-F]+\s+(?:in\s+)?(?P<function>.+)$"
+)
+MISMATCH_PATTERN = re.compile(r"^(Traps|Memory|Value)\b.* not match")
+ERROR_PATTERN = re.compile(
+    r"(ERROR: |Fatal error: |Program crashed: )(?P<message>.*)")
+
+
+def normalize(line):
+    line = re.sub(r"0x[0-9a-fA-F]+", "<addr>", line)
+    # Keep digits that are part of names such as `i32`
+    return re.sub(r"(?<![A-Za-z_\d])\d+", "N", line).strip()
+
+
+def frame_function(line):
+    match = FRAME_PATTERN.match(line)
+    if match is None:
+        return None
+    # Swift frames without an offset still name the image before the location
+    function = re.sub(r" in \S+ at /.*$", "", match.group("function"))
+    for separator in (" at /", " + ", " /", " ("):
+        function = function.split(separator)[0]
+    return function.strip()
+
+
+def bucket_signature(kind, output):
+    """Return the signature of a failure from its diagnostic output lines."""
+    headline = None
+    frames = []
+    for line in output:
+        if headline is None:
+            if MISMATCH_PATTERN.match(line):
+                headline = normalize(line)
+                continue
+            match = ERROR_PATTERN.search(line)
+            if match:
+                message = match.group("message")
+                # Drop the faulting address and thread details of sanitizer reports
+                message = re.split(r" on (?:address|unknown address)", message)[0]
+                headline = normalize(message)
+                continue
+        function = frame_function(line)
+        if function is None or len(frames) >= MAX_FRAMES:
+            continue
+        if function.startswith(IGNORED_FRAME_PREFIXES):
+            continue
+        frames.append(function)
+    return [kind, headline or "no diagnostics"] + frames
+
+
+class BucketIndex:
+    """Failures grouped by signature, keeping the smallest reproducer of each.
+
+    The index is a JSON file next to the directory holding the reproducers,
+    so that directory keeps containing nothing but testcases.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = directory.rstrip(os.sep) + ".index.json"
+        self.buckets = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.buckets = json.load(f)
+
+    @staticmethod
+    def bucket_id(signature):
+        import hashlib
+        return hashlib.sha1("\n".join(signature).encode()).hexdigest()[:12]
+
+    def reproducers(self):
+        return {bucket["reproducer"] for bucket in self.buckets.values()}
+
+    def add(self, file, signature, output, remove_duplicates=True, hits=1):
+        """Record `file`, a testcase saved in the failure directory, that
+        failed `hits` times.
+
+        Returns True if it became the reproducer of its bucket. The testcase
+        that is no longer needed, either `file` or the larger reproducer it
+        replaces, is deleted when `remove_duplicates` is set.
+        """
+        name = os.path.relpath(file, self.directory)
+        size = os.path.getsize(file)
+        now = time.strftime("%Y-%m-%dT%H:%M:%S")
+        key = self.bucket_id(signature)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            self.buckets[key] = {
+                "signature": signature, "hits": hits,
+                "first_seen": now, "last_seen": now,
+                "reproducer": name, "size": size,
+                "output": output[:MAX_SAMPLE_LINES],
+            }
+            self.save()
+            return True
+
+        bucket["hits"] += hits
+        bucket["last_seen"] = now
+        kept = False
+        if name != bucket["reproducer"] and size < bucket["size"]:
+            obsolete = os.path.join(self.directory, bucket["reproducer"])
+            bucket.update(reproducer=name, size=size,
+                          output=output[:MAX_SAMPLE_LINES])
+            kept = True
+        elif name != bucket["reproducer"]:
+            obsolete = file
+        else:
+            obsolete = None
+        if remove_duplicates and obsolete is not None:
+            base, ext = os.path.splitext(obsolete)
+            # The shrunk copy may have become the reproducer of the bucket
+            reproducers = self.reproducers()
+            for path in (obsolete, f"{base}.shrunk{ext}"):
+                if os.path.exists(path) and \
+                        os.path.relpath(path, self.directory) not in reproducers:
+                    os.remove(path)
+        self.save()
+        return kept
+
+    def replace_reproducer(self, file, shrunk_file):
+        """Make `shrunk_file`, a shrunk copy of the reproducer `file`, the
+        reproducer of its bucket.
+
+        Returns True if it was smaller and replaced `file`, which is then
+        deleted. Otherwise `shrunk_file` is deleted, e.g. when `file` was
+        replaced by a smaller testcase while it was being shrunk.
+        """
+        name = os.path.relpath(file, self.directory)
+        size = os.path.getsize(shrunk_file)
+        for bucket in self.buckets.values():
+            if bucket["reproducer"] == name and size < bucket["size"]:
+                bucket.update(
+                    reproducer=os.path.relpath(shrunk_file, self.directory),
+                    size=size)
+                self.save()
+                os.remove(file)
+                return True
+        os.remove(shrunk_file)
+        return False
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.buckets, f, indent=2, sort_keys=True)
+            f.write("\n")
+        os.replace(tmp_path, self.path)
+
+    def summary(self):
+        lines = []
+        buckets = sorted(self.buckets.items(), key=lambda item: -item[1]["hits"])
+        for key, bucket in buckets:
+            kind, headline = bucket["signature"][:2]
+            lines.append(f"{bucket['hits']:6} {key} {kind}: {headline}")
+            for frame in bucket["signature"][2:]:
+                lines.append(f"{'':20} at {frame}")
+            lines.append(f"{'':20} reproducer: {bucket['reproducer']}"
+                         f" ({bucket['size']} bytes)")
+        return "\n".join(lines)
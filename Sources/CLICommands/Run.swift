@@ -248,8 +248,14 @@ package struct Run: AsyncParsableCommand {
         }
 
         if #available(macOS 13.0, iOS 16.0, watchOS 9.0, tvOS 16.0, *) {
-            let (_, invokeTime) = try measure(execution: invoke)
-            log("Finished invoking function \"\(path)\": \(invokeTime)", verbose: true)
+            // WASI commands always finish by throwing `ExitCode`, so log the
+            // time on the way out instead of after a successful return.
+            let clock = ContinuousClock()
+            let start = clock.now
+            defer {
+                log("Finished invoking function \"\(path)\": \(clock.now - start)", verbose: true)
+            }
+            try invoke()
         } else {
             try invoke()
         }
@@ -22,15 +22,301 @@ def is_elf(file_path):
     return header == b'\x7fELF'
 
 
+def strip_binary(src_exe_path, dest_exe_path):
+    if is_elf(src_exe_path):
+        # For ELF binaries, use strip to remove debug symbols because
+        # most of static archives in static linux Swift SDK contains
+        # debug sections.
+        run(["llvm-strip", src_exe_path, "--strip-debug", "-o", dest_exe_path])
+    else:
+        shutil.copy(src_exe_path, dest_exe_path)
+
+
+def llvm_tool(name):
+    """Find an LLVM tool, preferring the one shipped with the Swift toolchain."""
+    swift = shutil.which("swift")
+    if swift is not None:
+        candidate = os.path.join(os.path.dirname(os.path.realpath(swift)), name)
+        if os.path.exists(candidate):
+            return candidate
+    return name
+
+
+def build_cli(scratch_path, extra_build_args, flags=[]):
+    """Build wasmkit-cli in `scratch_path` and return the path to it."""
+    build_args = [
+        "swift", "build", "-c", "release", "--product", "wasmkit-cli",
+        "--package-path", SOURCE_ROOT, "--scratch-path", scratch_path,
+    ] + flags + extra_build_args
+    bin_path = subprocess.check_output(build_args + ["--show-bin-path"], text=True).strip()
+    run(build_args)
+    return os.path.join(bin_path, "wasmkit-cli")
+
+
+def pgo_workloads(extra_modules):
+    """Return the modules to train and benchmark with, and the spec test directory.
+
+    CoreMark is used if it has been built (e.g. by `Benchmarks/bench.py`), but
+    it runs for a fixed time and so only takes part in the training.
+    """
+    vendor = os.path.join(SOURCE_ROOT, "Vendor")
+    suite = os.path.join(vendor, "wish-you-were-fast", "wasm", "suites", "libsodium")
+    modules = list(extra_modules)
+    if os.path.isdir(suite):
+        modules += sorted(
+            os.path.join(suite, name) for name in os.listdir(suite) if name.endswith(".wasm"))
+    training_modules = list(modules)
+    coremark = os.path.join(vendor, "coremark", "coremark.wasm")
+    if os.path.exists(coremark):
+        training_modules.append(coremark)
+    else:
+        print(f"Warning: {coremark} is not built; training without CoreMark", file=sys.stderr)
+    testsuite = os.path.join(vendor, "testsuite")
+    if not os.path.isdir(testsuite):
+        testsuite = None
+    if not modules:
+        print("No module to benchmark the PGO build with; run"
+              " `./Vendor/checkout-dependency` or pass --pgo-workload", file=sys.stderr)
+        sys.exit(1)
+    return modules, training_modules, testsuite
+
+
+def train(exe_path, modules, testsuite, profile_dir):
+    """Run the instrumented binary over the training workload."""
+    env = dict(os.environ)
+    # %m merges the profiles of runs of the same binary as they are written
+    env["LLVM_PROFILE_FILE"] = os.path.join(profile_dir, "wasmkit-%m.profraw")
+    commands = [[exe_path, "run", module] for module in modules]
+    if testsuite is not None:
+        commands.append([exe_path, "wast", testsuite])
+    for command in commands:
+        print("Training: " + " ".join(command))
+        # A failing workload still exercised the interpreter
+        subprocess.run(command, env=env, stdout=subprocess.DEVNULL, check=False)
+
+
+def time_binaries(exe_paths, modules, runs):
+    """Run every module with the binaries interleaved; return median seconds per module."""
+    import statistics
+    import time
+
+    timings = [{} for _ in exe_paths]
+    for module in modules:
+        samples = [[] for _ in exe_paths]
+        for _ in range(runs):
+            for exe_path, module_samples in zip(exe_paths, samples):
+                start = time.perf_counter()
+                subprocess.run([exe_path, "run", module], stdout=subprocess.DEVNULL, check=True)
+                module_samples.append(time.perf_counter() - start)
+        for module_timings, module_samples in zip(timings, samples):
+            module_timings[module] = statistics.median(module_samples)
+    return timings
+
+
+def build_pgo(args):
+    """Build wasmkit-cli with profile-guided optimization.
+
+    Returns the PGO binary if it beats a plain release build on the
+    benchmark workload, and exits otherwise.
+    """
+    pgo_dir = os.path.join(SOURCE_ROOT, ".build", "pgo")
+    profile_dir = os.path.join(pgo_dir, "profiles")
+    profdata = os.path.abspath(os.path.join(pgo_dir, "wasmkit.profdata"))
+    shutil.rmtree(profile_dir, ignore_errors=True)
+    os.makedirs(profile_dir)
+    modules, training_modules, testsuite = pgo_workloads(args.pgo_workload)
+
+    instrumented = build_cli(
+        os.path.join(pgo_dir, "instrumented"), args.extra_build_args,
+        ["-Xswiftc", "-profile-generate", "-Xcc", "-fprofile-instr-generate"])
+    train(instrumented, training_modules, testsuite, profile_dir)
+    profiles = [
+        os.path.join(profile_dir, name) for name in os.listdir(profile_dir)
+        if name.endswith(".profraw")
+    ]
+    if not profiles:
+        print("The training workload wrote no profile", file=sys.stderr)
+        sys.exit(1)
+    run([llvm_tool("llvm-profdata"), "merge", "-o", profdata] + profiles)
+
+    optimized = build_cli(
+        os.path.join(pgo_dir, "optimized"), args.extra_build_args,
+        ["-Xswiftc", f"-profile-use={profdata}", "-Xcc", f"-fprofile-instr-use={profdata}"])
+    plain = build_cli(os.path.join(SOURCE_ROOT, ".build"), args.extra_build_args)
+
+    plain_timings, pgo_timings = time_binaries([plain, optimized], modules, args.pgo_runs)
+    print(f"{'module':<40} {'plain':>10} {'pgo':>10} {'speedup':>8}")
+    for module in modules:
+        print(f"{os.path.basename(module):<40} {plain_timings[module]:>9.3f}s"
+              f" {pgo_timings[module]:>9.3f}s {plain_timings[module] / pgo_timings[module]:>7.3f}x")
+    speedup = sum(plain_timings.values()) / sum(pgo_timings.values())
+    print(f"PGO speedup over the plain build: {speedup:.3f}x")
+    if speedup <= args.pgo_min_speedup:
+        print(f"Refusing to ship the PGO build: its speedup of {speedup:.3f}x does not"
+              f" exceed {args.pgo_min_speedup:.3f}x", file=sys.stderr)
+        sys.exit(1)
+    return optimized
+
+
+# Axes of the variant matrix: (name, [(label, swift build arguments)]), the
+# first value of each axis being the one build-release.py ships with
+VARIANT_AXES = [
+    ("lto", [("nolto", []), ("lto", ["--experimental-lto-mode=full"])]),
+    ("stdlib", [("dynamic", []), ("static", ["--static-swift-stdlib"])]),
+    ("opt", [("O", []), ("Osize", ["-Xswiftc", "-Osize"])]),
+    ("debugging", [("nodebug", []), ("debug", [
+        "--traits", "FileSystem,MultiThread,Disassembler,WasmDebuggingSupport"])]),
+]
+
+# Sections summarized in the report, matched by substring of their names
+SECTION_GROUPS = [
+    ("text", ["text"]),
+    ("rodata", ["rodata", "__const", "__cstring"]),
+    ("swift", ["swift5"]),
+    ("unwind", ["eh_frame", "unwind_info", "gcc_except_table"]),
+    ("data", ["data"]),
+]
+
+# A module exporting an empty `_start`, so that `run` takes the WASI path
+EMPTY_COMMAND_MODULE = bytes([
+    0x00, 0x61, 0x73, 0x6d, 0x01, 0x00, 0x00, 0x00,
+    0x01, 0x04, 0x01, 0x60, 0x00, 0x00,
+    0x03, 0x02, 0x01, 0x00,
+    0x07, 0x0a, 0x01, 0x06]) + b"_start" + bytes([0x00, 0x00,
+    0x0a, 0x04, 0x01, 0x02, 0x00, 0x0b,
+])
+
+
+def section_sizes(exe_path):
+    """Return the size of every section of the binary."""
+    output = subprocess.check_output([llvm_tool("llvm-size"), "-A", exe_path], text=True)
+    sizes = {}
+    for line in output.splitlines():
+        fields = line.split()
+        if len(fields) >= 2 and fields[1].isdigit() and fields[0] != "Total":
+            sizes[fields[0]] = int(fields[1])
+    return sizes
+
+
+def group_sections(sizes):
+    groups = dict.fromkeys([name for name, _ in SECTION_GROUPS] + ["other"], 0)
+    for section, size in sizes.items():
+        # Uninitialized data takes no space in the binary
+        if "bss" in section:
+            continue
+        group = next((name for name, patterns in SECTION_GROUPS
+                      if any(pattern in section for pattern in patterns)), "other")
+        groups[group] += size
+    return groups
+
+
+def time_cold_start(exe_path, module_path, runs):
+    """Return the wall times of running the empty module, the first one first."""
+    import time
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([exe_path, "run", module_path], stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def build_matrix(args):
+    """Build every combination of the selected variant axes and report their
+    stripped size, section breakdown, and cold-start time."""
+    import csv
+    import itertools
+    import statistics
+
+    matrix_dir = args.matrix_dir
+    os.makedirs(matrix_dir, exist_ok=True)
+    module_path = os.path.join(matrix_dir, "empty.wasm")
+    with open(module_path, "wb") as f:
+        f.write(EMPTY_COMMAND_MODULE)
+
+    axes = [values for name, values in VARIANT_AXES if name in args.matrix_axis]
+    rows = []
+    section_rows = []
+    for combination in itertools.product(*axes):
+        variant = "-".join(label for label, _ in combination)
+        flags = [flag for _, axis_flags in combination for flag in axis_flags]
+        exe_path = build_cli(
+            os.path.join(matrix_dir, "scratch", variant), args.extra_build_args, flags)
+        stripped_path = os.path.join(matrix_dir, f"wasmkit-{variant}")
+        strip_binary(exe_path, stripped_path)
+
+        sizes = section_sizes(stripped_path)
+        times = time_cold_start(stripped_path, module_path, args.cold_start_runs)
+        row = {
+            "variant": variant, "size": os.path.getsize(stripped_path),
+            "first_run": times[0],
+            "median_run": statistics.median(times[1:] or times),
+        }
+        row.update(group_sections(sizes))
+        rows.append(row)
+        section_rows += [
+            {"variant": variant, "section": section, "size": size}
+            for section, size in sizes.items()
+        ]
+
+    columns = ["variant", "size"] + [name for name, _ in SECTION_GROUPS] + [
+        "other", "first_run", "median_run"]
+    with open(os.path.join(matrix_dir, "variants.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(os.path.join(matrix_dir, "sections.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["variant", "section", "size"])
+        writer.writeheader()
+        writer.writerows(section_rows)
+
+    def kib(size):
+        return f"{size / 1024:>9.0f}"
+
+    print(f"{'variant':<32} {'KiB':>9}" + "".join(
+        f" {name:>9}" for name in columns[2:-2]) + f" {'first ms':>9} {'p50 ms':>9}")
+    for row in sorted(rows, key=lambda row: row["size"]):
+        print(f"{row['variant']:<32} {kib(row['size'])}"
+              + "".join(f" {kib(row[name])}" for name in columns[2:-2])
+              + f" {row['first_run'] * 1000:>9.1f} {row['median_run'] * 1000:>9.1f}")
+    print(f"Per-variant and per-section sizes are in {matrix_dir}")
+
+
 def main():
     import argparse
     parser = argparse.ArgumentParser()
-    parser.add_argument("-o", "--output", required=True)
-    parser.add_argument("-s", "--semantic-version", required=True)
+    parser.add_argument("-o", "--output")
+    parser.add_argument("-s", "--semantic-version")
+    parser.add_argument("--pgo", action="store_true",
+                        help="Ship a profile-guided optimized build if it beats the plain one")
+    parser.add_argument("--pgo-workload", action="append", default=[],
+                        help="Additional WASI module to train and benchmark the PGO build with")
+    parser.add_argument("--pgo-runs", type=int, default=5,
+                        help="Runs of each module when comparing the PGO and plain builds")
+    parser.add_argument("--pgo-min-speedup", type=float, default=1.0,
+                        help="Speedup over the plain build the PGO build must exceed")
+    parser.add_argument("--matrix", action="store_true",
+                        help="Instead of releasing, build a matrix of configuration variants"
+                             " and report their binary size and cold-start time")
+    parser.add_argument("--matrix-axis", action="append",
+                        choices=[name for name, _ in VARIANT_AXES],
+                        help="Axis of the variant matrix to vary (repeatable; default: all)")
+    parser.add_argument("--matrix-dir", default=os.path.join(SOURCE_ROOT, ".build", "variants"),
+                        help="Directory for the variant builds and the report")
+    parser.add_argument("--cold-start-runs", type=int, default=20,
+                        help="Runs of an empty module to time the cold start of each variant")
     parser.add_argument("extra_build_args", nargs="*")
 
     args = parser.parse_args()
 
+    if args.matrix:
+        if args.matrix_axis is None:
+            args.matrix_axis = [name for name, _ in VARIANT_AXES]
+        build_matrix(args)
+        return
+    if args.output is None or args.semantic_version is None:
+        parser.error("the following arguments are required: -o/--output, -s/--semantic-version")
+
     # Check that `README.md` has been updated with the latest version.
     version_ok = False
     with open(os.path.join(SOURCE_ROOT, 'README.md')) as file:
@@ -53,10 +339,14 @@ def main():
       print("Expected `Sources/CLI/CLI.swift` to specify the newly released version.", file=sys.stderr)
       sys.exit(1)
 
-    build_args = ["swift", "build", "-c", "release", "--product", "wasmkit-cli", "--package-path", SOURCE_ROOT] + args.extra_build_args
-    bin_path = subprocess.check_output(build_args + ["--show-bin-path"], text=True).strip()
+    if args.pgo:
+        src_exe_path = build_pgo(args)
+    else:
+        build_args = ["swift", "build", "-c", "release", "--product", "wasmkit-cli", "--package-path", SOURCE_ROOT] + args.extra_build_args
+        bin_path = subprocess.check_output(build_args + ["--show-bin-path"], text=True).strip()
 
-    run(build_args)
+        run(build_args)
+        src_exe_path = os.path.join(bin_path, "wasmkit-cli")
 
     if not args.output.endswith(".tar.gz"):
         raise ValueError("Output file name must end with .tar.gz")
@@ -64,15 +354,7 @@ def main():
     shutil.rmtree(archive_path, ignore_errors=True)
     os.makedirs(archive_path)
 
-    src_exe_path = os.path.join(bin_path, "wasmkit-cli")
-    dest_exe_path = os.path.join(archive_path, "wasmkit")
-    if is_elf(src_exe_path):
-        # For ELF binaries, use strip to remove debug symbols because
-        # most of static archives in static linux Swift SDK contains
-        # debug sections.
-        run(["llvm-strip", src_exe_path, "--strip-debug", "-o", dest_exe_path])
-    else:
-        shutil.copy(src_exe_path, dest_exe_path)
+    strip_binary(src_exe_path, os.path.join(archive_path, "wasmkit"))
 
     with tarfile.open(args.output, "w:gz") as tar:
         tar.add(archive_path, arcname=os.path.basename(archive_path))
@@ -3,8 +3,10 @@
 import argparse
 import subprocess
 import os
+import sys
 
 SOURCE_ROOT = os.path.relpath(os.path.join(os.path.dirname(__file__), ".."))
+CACHE_PATH = os.path.join(SOURCE_ROOT, ".build", "format-cache.json")
 
 
 def run(arguments):
@@ -27,34 +29,192 @@ def build_swift_format() -> list[str]:
     return [bin_path]
 
 
+def is_format_target(path: str) -> bool:
+    """Whether the file, relative to SOURCE_ROOT, is formatted by this script."""
+    if not path.endswith(".swift"):
+        return False
+    if os.path.dirname(path) == "":
+        return path.startswith("Package")
+    return path.split(os.sep)[0] in ["Sources", "Tests"]
+
+
+def all_files() -> list[str]:
+    files = [
+        name for name in os.listdir(SOURCE_ROOT)
+        if is_format_target(name)
+    ]
+    for targets_dir in ["Sources", "Tests"]:
+        targets_path = os.path.join(SOURCE_ROOT, targets_dir)
+        for dirpath, _, filenames in os.walk(targets_path):
+            for filename in filenames:
+                path = os.path.relpath(os.path.join(dirpath, filename), SOURCE_ROOT)
+                if is_format_target(path):
+                    files.append(path)
+    return sorted(files)
+
+
+def changed_files(base: str | None) -> list[str]:
+    """Swift files changed since `base`, or staged in the index if it is None."""
+    against = ["--cached"] if base is None else [base]
+    output = subprocess.check_output(
+        ["git", "-C", SOURCE_ROOT, "diff"] + against + ["--name-only", "--diff-filter=ACMR", "--relative"],
+        text=True)
+    files = [os.path.normpath(line) for line in output.splitlines()]
+    if base is not None:
+        # New files are not in the diff until they are added
+        output = subprocess.check_output(
+            ["git", "-C", SOURCE_ROOT, "ls-files", "--others", "--exclude-standard"],
+            text=True)
+        files += [os.path.normpath(line) for line in output.splitlines()]
+    return sorted({path for path in files if is_format_target(path)})
+
+
+def content_hash(path: str) -> str:
+    import hashlib
+    with open(os.path.join(SOURCE_ROOT, path), "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class FormatCache:
+    """Content hashes of files known to be formatted.
+
+    The cache is only valid for the swift-format binary and configuration it
+    was written with, so it starts empty when either of them changes.
+    """
+
+    def __init__(self, path: str, formatter: str):
+        import json
+        self.path = path
+        self.formatter = formatter
+        self.hashes = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                cache = json.load(f)
+            if cache.get("formatter") == formatter:
+                self.hashes = cache["files"]
+
+    def is_formatted(self, path: str) -> bool:
+        return self.hashes.get(path) == content_hash(path)
+
+    def add(self, path: str):
+        self.hashes[path] = content_hash(path)
+
+    def save(self):
+        import json
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"formatter": self.formatter, "files": self.hashes}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def formatter_identity(swift_format: list[str]) -> str:
+    """Identify the formatter by its version and the configuration it reads."""
+    version = subprocess.run(
+        swift_format + ["--version"], capture_output=True, text=True).stdout.strip()
+    config_path = os.path.join(SOURCE_ROOT, ".swift-format")
+    config = content_hash(".swift-format") if os.path.exists(config_path) else ""
+    return f"{' '.join(swift_format)} {version} {config}"
+
+
+def balanced_batches(files: list[str], count: int) -> list[list[str]]:
+    """Split files into `count` batches of about the same total size."""
+    import heapq
+    batches = [(0, i, []) for i in range(count)]
+    sizes = {path: os.path.getsize(os.path.join(SOURCE_ROOT, path)) for path in files}
+    # Largest first into the lightest batch
+    for path in sorted(files, key=lambda path: -sizes[path]):
+        total, i, batch = heapq.heappop(batches)
+        batch.append(path)
+        heapq.heappush(batches, (total + sizes[path], i, batch))
+    return [batch for _, _, batch in sorted(batches, key=lambda item: item[1]) if batch]
+
+
+def format_batch(swift_format: list[str], batch: list[str], check: bool) -> tuple[list[str], str]:
+    """Format or check the batch; return the files that were not formatted and
+    the output of swift-format."""
+    paths = [os.path.join(SOURCE_ROOT, path) for path in batch]
+    if not check:
+        arguments = swift_format + ["format", "--in-place"]
+        result = subprocess.run(arguments + paths, capture_output=True, text=True)
+        output = result.stdout + result.stderr
+        if result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, arguments, output)
+        return [], output
+    # swift-format prints a formatted file to stdout, so each file is
+    # formatted alone and compared with its contents
+    unformatted = []
+    output = ""
+    for path, full_path in zip(batch, paths):
+        arguments = swift_format + ["format", full_path]
+        result = subprocess.run(arguments, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise subprocess.CalledProcessError(
+                result.returncode, arguments, result.stdout + result.stderr)
+        output += result.stderr
+        with open(full_path) as f:
+            if f.read() != result.stdout:
+                unformatted.append(path)
+    return unformatted, output
+
+
 def main():
     parser = argparse.ArgumentParser(
                     prog='WasmKit codebase formatter',
                     description='Ensures that codebase formatting is consistent')
     parser.add_argument('-b', '--build-swift-format', action='store_true')
+    parser.add_argument('--check', action='store_true',
+                        help='Report unformatted files without rewriting them')
+    parser.add_argument('--changed', action='store_true',
+                        help='Only format the Swift files staged in the index')
+    parser.add_argument('--base', metavar='REF',
+                        help='Only format the Swift files changed since REF, including untracked ones')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='Number of swift-format processes to run in parallel')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Format files even if they are known to be formatted')
     args = parser.parse_args()
 
-    targets = []
-    for targets_dir in ["Sources", "Tests"]:
-        targets_path = os.path.join(SOURCE_ROOT, targets_dir)
-        for target in os.listdir(targets_path):
-            if not os.path.isdir(os.path.join(targets_path, target)):
-                continue
-            targets.append(os.path.join(targets_dir, target))
-
     if args.build_swift_format:
       swift_format = build_swift_format()
     else:
       swift_format = ["swift", "format"]
 
-    arguments = swift_format + [
-        "format", "--in-place", "--recursive", "--parallel"
-    ]
-    for target in targets:
-        arguments.append(os.path.join(SOURCE_ROOT, target))
-    arguments.append(os.path.join(SOURCE_ROOT, "Package.swift"))
-    arguments.append(os.path.join(SOURCE_ROOT, "Package@swift-6.1.swift"))
-    run(arguments)
+    if args.base is not None or args.changed:
+        files = changed_files(args.base)
+    else:
+        files = all_files()
+
+    cache = FormatCache(CACHE_PATH, formatter_identity(swift_format))
+    if not args.no_cache:
+        files = [path for path in files if not cache.is_formatted(path)]
+    if not files:
+        print("All files are formatted")
+        return
+
+    from concurrent.futures import ThreadPoolExecutor
+    batches = balanced_batches(files, max(1, args.jobs))
+    print(f"{'Checking' if args.check else 'Formatting'} {len(files)} files"
+          f" in {len(batches)} batches")
+    unformatted = []
+    try:
+        with ThreadPoolExecutor(max_workers=len(batches)) as executor:
+            for batch, (batch_unformatted, output) in zip(
+                    batches, executor.map(lambda batch: format_batch(swift_format, batch, args.check), batches)):
+                if output:
+                    print(output, end="")
+                unformatted += batch_unformatted
+                for path in batch:
+                    if path not in batch_unformatted:
+                        cache.add(path)
+    finally:
+        cache.save()
+
+    if unformatted:
+        print(f"{len(unformatted)} files are not formatted:")
+        for path in unformatted:
+            print(f"  {path}")
+        sys.exit(1)
 
 
 if __name__ == "__main__":